@@ -1,38 +1,330 @@
-from flask import Flask, render_template, request, redirect, session, flash
+from flask import Flask, render_template, request, redirect, session, flash, g, Response, url_for, abort, send_from_directory
+from flask import before_render_template, template_rendered, stream_with_context, has_request_context
 import sqlite3
 import os
-import uuid
+import queue
+import collections
+import shutil
+import tempfile
+import random
+import csv
+import io
+import hashlib
+import urllib.parse
+import secrets
+import mimetypes
+import heapq
+import math
+import json
+import datetime
+import sys
+import threading
+import functools
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from sqlite3 import IntegrityError
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
 from werkzeug.utils import secure_filename
+from xml.sax.saxutils import escape as xml_escape
+from flask.sessions import SessionInterface, SecureCookieSession
+from flask.json.tag import TaggedJSONSerializer
 import smtplib
 from email.message import EmailMessage
 import time
-import google.generativeai as genai
+import re
+import string
+import click
 app = Flask(__name__)
 app.secret_key = "hostel_secret"
 UPLOAD_FOLDER = "static/uploads"
+ID_CARD_FOLDER = "private/id_cards"   # not under static: served only via /id_card
 from dotenv import load_dotenv # Add this at the top with other imports
 load_dotenv() 
 
-# This pulls the key from your .env file automatically
-api_key = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=api_key)
-
-model = genai.GenerativeModel( 'gemini-3-flash-preview' )
+# This pulls the key from your .env file automatically; the model client
+# itself is only built when /chat first needs it (get_chat_model)
+app.config["GEMINI_API_KEY"] = os.getenv("GEMINI_API_KEY")
+app.config["CHAT_MODEL"] = os.getenv("CHAT_MODEL", "gemini-3-flash-preview")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(ID_CARD_FOLDER, exist_ok=True)
 
 
 
 # database
+app.config["DATABASE"] = os.getenv("DATABASE", "database.db")
+app.config["DB_POOL_SIZE"] = 8           # idle connections kept per worker
+app.config["DB_POOL_TIMEOUT"] = 5.0      # seconds to wait for a free connection
+app.config["DB_POOL_RECYCLE"] = 3600     # reopen connections older than this
+app.config["DB_BUSY_TIMEOUT"] = 10000    # ms sqlite waits on a locked database
+app.config["DB_MMAP_SIZE"] = 64 * 1024 * 1024
+app.config["DB_STATEMENT_CACHE"] = 256   # prepared statements cached per connection
+app.config["SHARDING"] = os.getenv("SHARDING", "0") == "1"   # one database file per college
+app.config["SHARD_DIR"] = os.getenv("SHARD_DIR", "shards")
+app.config["SHARD_POOL_SIZE"] = 2        # idle connections kept per shard per worker
+app.config["SHARD_POOLS_MAX"] = 64       # shard pools kept open per worker
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that remembers when it was opened.
+
+    While `profile` is set (PROFILE=1, see get_db) every statement is
+    timed into that RequestProfile.
+    """
+
+    profile = None
+    pool = None       # the ConnectionPool that opened it
+    archives = None   # archive list attach_archives() last set up
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened_at = time.monotonic()
+
+    def execute(self, sql, parameters=()):
+        if self.profile is None:
+            return super().execute(sql, parameters)
+        return self.profile.run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if self.profile is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.profile.run(super().executemany, sql, seq_of_parameters)
+
+
+class ConnectionPool:
+    """Per-process pool of tuned SQLite connections.
+
+    Connections are handed out once per app context by get_db() and given
+    back in teardown_appcontext, so a request pays for connect + PRAGMAs
+    only when the pool is cold.
+    """
+
+    def __init__(self, path, size=8, timeout=5.0, recycle=3600):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.closed = False
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Connections must never cross a fork (gunicorn --preload)
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._open = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "timeouts": 0,
+            "opened": 0,
+            "closed": 0,
+            "lifetime_total": 0.0,
+            "lifetime_max": 0.0,
+        }
+
+    def _connect(self):
+        db = sqlite3.connect(
+            self.path,
+            timeout=app.config["DB_BUSY_TIMEOUT"] / 1000,
+            factory=PooledConnection,
+            cached_statements=app.config["DB_STATEMENT_CACHE"],
+            check_same_thread=False,
+        )
+        db.row_factory = sqlite3.Row
+        db.pool = self
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = NORMAL")
+        db.execute(f"PRAGMA busy_timeout = {int(app.config['DB_BUSY_TIMEOUT'])}")
+        db.execute(f"PRAGMA mmap_size = {int(app.config['DB_MMAP_SIZE'])}")
+        db.execute("PRAGMA temp_store = MEMORY")
+        db.execute("PRAGMA foreign_keys = ON")
+        self._open += 1
+        self.stats["opened"] += 1
+        return db
+
+    def _discard(self, db):
+        lifetime = time.monotonic() - db.opened_at
+        db.close()
+        with self._lock:
+            self._open -= 1
+            self.stats["closed"] += 1
+            self.stats["lifetime_total"] += lifetime
+            self.stats["lifetime_max"] = max(self.stats["lifetime_max"], lifetime)
+
+    def acquire(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                self._reset()
+
+        while True:
+            try:
+                db = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if time.monotonic() - db.opened_at > self.recycle:
+                self._discard(db)
+                continue
+            with self._lock:
+                self.stats["hits"] += 1
+            return db
+
+        with self._lock:
+            if self._open < self.size:
+                self.stats["misses"] += 1
+                return self._connect()
+            self.stats["waits"] += 1
+
+        started = time.monotonic()
+        try:
+            db = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            # Pool exhausted: hand out an overflow connection rather than fail
+            with self._lock:
+                self.stats["timeouts"] += 1
+                return self._connect()
+        finally:
+            with self._lock:
+                self.stats["wait_time"] += time.monotonic() - started
+        return db
+
+    def release(self, db):
+        if self._pid != os.getpid():
+            return
+        if db.in_transaction:
+            db.rollback()
+        # decided under the lock so nothing slips into a pool close() drained
+        with self._lock:
+            keep = not self.closed and self._idle.qsize() < self.size
+            if keep:
+                self._idle.put(db)
+        if not keep:
+            self._discard(db)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["open"] = self._open
+            stats["idle"] = self._idle.qsize()
+        closed = stats["closed"]
+        stats["lifetime_avg"] = stats["lifetime_total"] / closed if closed else 0.0
+        return stats
+
+    def close(self):
+        """Retire the pool, e.g. before a gunicorn --preload fork: idle
+        connections are closed now, checked-out ones when released."""
+        with self._lock:
+            self.closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+def get_pool():
+    old = app.extensions.get("db_pool")
+    pool = old
+    if pool is None or pool.path != app.config["DATABASE"] or pool.size != app.config["DB_POOL_SIZE"]:
+        if old is not None:
+            old.close()   # connections still checked out are closed on release
+        pool = ConnectionPool(
+            app.config["DATABASE"],
+            size=app.config["DB_POOL_SIZE"],
+            timeout=app.config["DB_POOL_TIMEOUT"],
+            recycle=app.config["DB_POOL_RECYCLE"],
+        )
+        app.extensions["db_pool"] = pool
+
+        # Bring an existing database up to the current schema version once
+        # per process; fresh databases are migrated by init_db()
+        db = pool.acquire()
+        try:
+            if db.execute("""
+                SELECT 1 FROM sqlite_master WHERE type='table' AND name='users'
+            """).fetchone():
+                migrate_db(db)
+        finally:
+            pool.release(db)
+    return pool
+
+
 def get_db():
-    db = sqlite3.connect("database.db")
-    db.row_factory = sqlite3.Row
-    db.execute("PRAGMA foreign_keys = ON")
-    return db
+    """Return the connection bound to the current app context.
+
+    With SHARDING that is the logged-in user's college shard; requests
+    without a college (admin, login, registration) and CLI commands get
+    the main database.
+    """
+    if "db" not in g:
+        college = session.get("college") if has_request_context() else None
+        g.db = college_db(college)
+    return g.db
+
+
+def main_db():
+    """The main database: sessions, mail, admins and the user directory."""
+    if "main_db" not in g:
+        g.main_db = get_pool().acquire()
+        g.main_db.profile = g.get("profile")
+    return g.main_db
+
+
+@app.teardown_appcontext
+def close_db(exc):
+    g.pop("db", None)
+    db = g.pop("main_db", None)
+    if db is not None:
+        db.profile = None
+        db.pool.release(db)
+    for pool, db in g.pop("shard_dbs", {}).values():
+        db.profile = None
+        pool.release(db)
+
+def background_executor(name, workers):
+    """Per-process ThreadPoolExecutor; a forked worker gets its own threads."""
+    key = (os.getpid(), name)
+    executor = background_executors.get(key)
+    if executor is None:
+        with background_executors_lock:
+            executor = background_executors.get(key)
+            if executor is None:
+                executor = background_executors[key] = ThreadPoolExecutor(
+                    workers, thread_name_prefix=name)
+    return executor
+
+
+background_executors = {}
+background_executors_lock = threading.Lock()
+
+
+def create_app(config=None):
+    """Apply `config`, create or migrate the database, and return the app.
+
+    Nothing here leaves threads or SQLite connections behind, so it is
+    safe in a gunicorn --preload master; templates are compiled up front
+    and shared copy-on-write by the forked workers:
+
+        gunicorn --preload -w 4 'app:create_app()'
+    """
+    if config:
+        app.config.update(config)
+    with app.app_context():
+        init_db()
+        get_pool()   # migrates an existing database
+    pool = app.extensions.pop("db_pool", None)
+    if pool is not None:
+        pool.close()
+    while shard_pools:
+        shard_pools.popitem()[1].close()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    return app
+
 
 def init_db():
-    if not os.path.exists("database.db"):
+    if not os.path.exists(app.config["DATABASE"]):
         db = get_db()
         with open("database.sql") as f:
             db.executescript(f.read())
@@ -40,12 +332,1211 @@ def init_db():
         db.execute("""
             INSERT INTO users(username,password,role,approved)
             VALUES (?,?,?,1)
-        """, ("admin", generate_password_hash("admin123"), "admin"))
+        """, ("admin", hash_password("admin123"), "admin"))
 
         db.commit()
-        db.close()
+        migrate_db(db)
         print("Database initialized")
 
+# ---------------- MIGRATIONS ----------------
+# database.sql is schema version 0; each entry below moves the schema one
+# version forward and is recorded in PRAGMA user_version. Append only.
+MIGRATIONS = [
+    # 1: secondary indexes for the dashboard access paths
+    """
+    CREATE INDEX IF NOT EXISTS idx_users_role_approved_college
+        ON users(role, approved, college);
+    CREATE INDEX IF NOT EXISTS idx_users_college ON users(college);
+    CREATE INDEX IF NOT EXISTS idx_hostels_college ON hostels(college);
+    CREATE INDEX IF NOT EXISTS idx_hostels_warden ON hostels(warden_id);
+    CREATE INDEX IF NOT EXISTS idx_rooms_hostel ON rooms(hostel_id);
+    CREATE INDEX IF NOT EXISTS idx_applications_status_student
+        ON applications(status, student_id);
+    CREATE INDEX IF NOT EXISTS idx_applications_student ON applications(student_id);
+    CREATE INDEX IF NOT EXISTS idx_applications_hostel ON applications(hostel_id);
+    CREATE INDEX IF NOT EXISTS idx_applications_room ON applications(room_id);
+    CREATE INDEX IF NOT EXISTS idx_attendance_student_date
+        ON attendance(student_id, date, status);
+    CREATE INDEX IF NOT EXISTS idx_attendance_warden_date
+        ON attendance(warden_id, date);
+    CREATE INDEX IF NOT EXISTS idx_room_photos_hostel ON room_photos(hostel_id);
+    CREATE INDEX IF NOT EXISTS idx_room_photos_room ON room_photos(room_id);
+    CREATE INDEX IF NOT EXISTS idx_room_photos_warden ON room_photos(warden_id);
+    """,
+    # 2: index orders that match the (date, id) keyset of the attendance feeds
+    """
+    DROP INDEX IF EXISTS idx_attendance_student_date;
+    CREATE INDEX idx_attendance_student_date ON attendance(student_id, date);
+    CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date);
+    """,
+    # 3: one attendance row per student per day (keeps the latest duplicate)
+    """
+    DELETE FROM attendance
+    WHERE id NOT IN (
+        SELECT MAX(id) FROM attendance GROUP BY student_id, date
+    );
+    DROP INDEX IF EXISTS idx_attendance_student_date;
+    CREATE UNIQUE INDEX idx_attendance_student_date ON attendance(student_id, date);
+    """,
+    # 4: attendance summaries kept current by triggers on attendance
+    """
+    CREATE TABLE attendance_monthly (
+        student_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        present INTEGER NOT NULL DEFAULT 0,
+        absent INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (student_id, month)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE attendance_daily_college (
+        college TEXT NOT NULL,
+        date TEXT NOT NULL,
+        present INTEGER NOT NULL DEFAULT 0,
+        absent INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (college, date)
+    ) WITHOUT ROWID;
+
+    INSERT INTO attendance_monthly (student_id, month, present, absent)
+    SELECT student_id, substr(date, 1, 7),
+           SUM(status = 'present'), SUM(status = 'absent')
+    FROM attendance
+    GROUP BY student_id, substr(date, 1, 7);
+
+    INSERT INTO attendance_daily_college (college, date, present, absent)
+    SELECT u.college, a.date,
+           SUM(a.status = 'present'), SUM(a.status = 'absent')
+    FROM attendance a
+    JOIN users u ON a.student_id = u.id
+    WHERE u.college IS NOT NULL
+    GROUP BY u.college, a.date;
+
+    CREATE TRIGGER trg_attendance_summary_insert AFTER INSERT ON attendance
+    BEGIN
+        INSERT INTO attendance_monthly (student_id, month, present, absent)
+        VALUES (NEW.student_id, substr(NEW.date, 1, 7),
+                NEW.status = 'present', NEW.status = 'absent')
+        ON CONFLICT (student_id, month) DO UPDATE SET
+            present = present + excluded.present,
+            absent = absent + excluded.absent;
+
+        INSERT INTO attendance_daily_college (college, date, present, absent)
+        SELECT college, NEW.date, NEW.status = 'present', NEW.status = 'absent'
+        FROM users WHERE id = NEW.student_id AND college IS NOT NULL
+        ON CONFLICT (college, date) DO UPDATE SET
+            present = present + excluded.present,
+            absent = absent + excluded.absent;
+    END;
+
+    CREATE TRIGGER trg_attendance_summary_delete AFTER DELETE ON attendance
+    BEGIN
+        UPDATE attendance_monthly
+        SET present = present - (OLD.status = 'present'),
+            absent = absent - (OLD.status = 'absent')
+        WHERE student_id = OLD.student_id AND month = substr(OLD.date, 1, 7);
+
+        UPDATE attendance_daily_college
+        SET present = present - (OLD.status = 'present'),
+            absent = absent - (OLD.status = 'absent')
+        WHERE college = (SELECT college FROM users WHERE id = OLD.student_id)
+        AND date = OLD.date;
+    END;
+
+    CREATE TRIGGER trg_attendance_summary_update
+    AFTER UPDATE OF student_id, date, status ON attendance
+    BEGIN
+        UPDATE attendance_monthly
+        SET present = present - (OLD.status = 'present'),
+            absent = absent - (OLD.status = 'absent')
+        WHERE student_id = OLD.student_id AND month = substr(OLD.date, 1, 7);
+
+        UPDATE attendance_daily_college
+        SET present = present - (OLD.status = 'present'),
+            absent = absent - (OLD.status = 'absent')
+        WHERE college = (SELECT college FROM users WHERE id = OLD.student_id)
+        AND date = OLD.date;
+
+        INSERT INTO attendance_monthly (student_id, month, present, absent)
+        VALUES (NEW.student_id, substr(NEW.date, 1, 7),
+                NEW.status = 'present', NEW.status = 'absent')
+        ON CONFLICT (student_id, month) DO UPDATE SET
+            present = present + excluded.present,
+            absent = absent + excluded.absent;
+
+        INSERT INTO attendance_daily_college (college, date, present, absent)
+        SELECT college, NEW.date, NEW.status = 'present', NEW.status = 'absent'
+        FROM users WHERE id = NEW.student_id AND college IS NOT NULL
+        ON CONFLICT (college, date) DO UPDATE SET
+            present = present + excluded.present,
+            absent = absent + excluded.absent;
+    END;
+    """,
+    # 5: block / floor layout of generated rooms
+    """
+    ALTER TABLE rooms ADD COLUMN block TEXT;
+    ALTER TABLE rooms ADD COLUMN floor INTEGER;
+    """,
+    # 6: available_rooms counts rooms with a free bed, kept by trigger
+    """
+    UPDATE hostels
+    SET available_rooms = (
+        SELECT COUNT(*) FROM rooms
+        WHERE rooms.hostel_id = hostels.id AND occupied < capacity
+    );
+
+    CREATE TRIGGER trg_rooms_available
+    AFTER UPDATE OF occupied, capacity ON rooms
+    WHEN (OLD.occupied < OLD.capacity) != (NEW.occupied < NEW.capacity)
+    BEGIN
+        UPDATE hostels
+        SET available_rooms = available_rooms
+            + CASE WHEN NEW.occupied < NEW.capacity THEN 1 ELSE -1 END
+        WHERE id = NEW.hostel_id;
+    END;
+    """,
+    # 7: per-scope version counters for the dashboard fragment cache
+    """
+    CREATE TABLE cache_versions (
+        scope TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+    """,
+    # 8: outbox for mail sent by the background Mailer
+    """
+    CREATE TABLE mail_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        to_addr TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        body TEXT NOT NULL,
+        status TEXT CHECK (
+            status IN ('pending','sending','sent','failed')
+        ) NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        last_error TEXT,
+        created_at REAL NOT NULL,
+        sent_at REAL
+    );
+    CREATE INDEX idx_mail_outbox_due ON mail_outbox(status, next_attempt_at);
+    """,
+    # 9: server-side sessions (SqliteSessionStore)
+    """
+    CREATE TABLE sessions (
+        sid TEXT PRIMARY KEY,
+        uid INTEGER,
+        data TEXT NOT NULL,
+        expires REAL NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX idx_sessions_uid ON sessions(uid);
+    CREATE INDEX idx_sessions_expires ON sessions(expires);
+    """,
+    # 10: pending approval queues, walked per college in id order
+    """
+    CREATE INDEX idx_users_pending ON users(college, id) WHERE approved=0;
+    """,
+    # 11: room search - an FTS5 index over facilities/damage/hostel name and
+    # one room_tags row per comma-separated facility, both kept by triggers.
+    # facility_tags is the facilities list as a JSON array for json_each
+    # (triggers cannot split strings with a CTE); '[]' if it is not valid.
+    r"""
+    ALTER TABLE rooms ADD COLUMN facility_tags TEXT GENERATED ALWAYS AS (
+        CASE WHEN json_valid('["' || replace(replace(replace(replace(replace(
+                replace(facilities, '\', ''), '"', ''), char(9), ' '),
+                char(10), ' '), char(13), ' '), ',', '","') || '"]')
+             THEN '["' || replace(replace(replace(replace(replace(
+                replace(facilities, '\', ''), '"', ''), char(9), ' '),
+                char(10), ' '), char(13), ' '), ',', '","') || '"]'
+             ELSE '[]' END
+    ) VIRTUAL;
+
+    CREATE VIRTUAL TABLE rooms_fts USING fts5(
+        facilities, damage, hostel_name, prefix='2 3'
+    );
+    CREATE TABLE room_tags (
+        room_id INTEGER NOT NULL,
+        tag TEXT NOT NULL,
+        PRIMARY KEY (room_id, tag)
+    ) WITHOUT ROWID;
+    CREATE INDEX idx_room_tags_tag ON room_tags(tag, room_id);
+
+    INSERT INTO rooms_fts (rowid, facilities, damage, hostel_name)
+    SELECT r.id, r.facilities, r.damage, h.name
+    FROM rooms r
+    LEFT JOIN hostels h ON h.id = r.hostel_id;
+
+    INSERT OR IGNORE INTO room_tags (room_id, tag)
+    SELECT r.id, lower(trim(t.value))
+    FROM rooms r, json_each(r.facility_tags) t
+    WHERE trim(t.value) != '';
+
+    CREATE TRIGGER trg_rooms_search_insert AFTER INSERT ON rooms
+    BEGIN
+        INSERT INTO rooms_fts (rowid, facilities, damage, hostel_name)
+        VALUES (NEW.id, NEW.facilities, NEW.damage,
+                (SELECT name FROM hostels WHERE id = NEW.hostel_id));
+
+        INSERT OR IGNORE INTO room_tags (room_id, tag)
+        SELECT NEW.id, lower(trim(value)) FROM json_each(NEW.facility_tags)
+        WHERE trim(value) != '';
+    END;
+
+    CREATE TRIGGER trg_rooms_search_update
+    AFTER UPDATE OF facilities, damage, hostel_id ON rooms
+    WHEN OLD.facilities IS NOT NEW.facilities OR OLD.damage IS NOT NEW.damage
+        OR OLD.hostel_id IS NOT NEW.hostel_id
+    BEGIN
+        UPDATE rooms_fts
+        SET facilities = NEW.facilities, damage = NEW.damage,
+            hostel_name = (SELECT name FROM hostels WHERE id = NEW.hostel_id)
+        WHERE rowid = NEW.id;
+
+        DELETE FROM room_tags WHERE room_id = NEW.id;
+        INSERT OR IGNORE INTO room_tags (room_id, tag)
+        SELECT NEW.id, lower(trim(value)) FROM json_each(NEW.facility_tags)
+        WHERE trim(value) != '';
+    END;
+
+    CREATE TRIGGER trg_rooms_search_delete AFTER DELETE ON rooms
+    BEGIN
+        DELETE FROM rooms_fts WHERE rowid = OLD.id;
+        DELETE FROM room_tags WHERE room_id = OLD.id;
+    END;
+
+    CREATE TRIGGER trg_hostels_search_rename AFTER UPDATE OF name ON hostels
+    WHEN OLD.name IS NOT NEW.name
+    BEGIN
+        UPDATE rooms_fts SET hostel_name = NEW.name
+        WHERE rowid IN (SELECT id FROM rooms WHERE hostel_id = NEW.id);
+    END;
+    """,
+    # 12: attendance archives, one read-only file per closed academic year
+    # (attach_archives shadows attendance_all with a view over all of them)
+    """
+    CREATE TABLE attendance_archives (
+        year INTEGER PRIMARY KEY,
+        filename TEXT NOT NULL,
+        date_from TEXT NOT NULL,
+        date_to TEXT NOT NULL,
+        rows INTEGER NOT NULL,
+        archived_at REAL NOT NULL
+    );
+    CREATE VIEW attendance_all AS
+        SELECT id, student_id, warden_id, date, status FROM attendance;
+    """,
+    # 13: SHARDING, the shard file of every college (used in the main database)
+    """
+    CREATE TABLE shards (
+        college TEXT PRIMARY KEY,
+        filename TEXT NOT NULL UNIQUE
+    ) WITHOUT ROWID;
+    """,
+]
+
+
+def split_sql(script):
+    """Split a SQL script into complete statements (trigger bodies included)."""
+    statements, buf = [], ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            statements.append(buf.strip())
+            buf = ""
+    if buf.strip():
+        statements.append(buf.strip())
+    return statements
+
+
+def migrate_db(db):
+    """Apply pending MIGRATIONS, one transaction per version."""
+    while True:
+        # IMMEDIATE so concurrently booting workers migrate one at a time
+        db.execute("BEGIN IMMEDIATE")
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version >= len(MIGRATIONS):
+            db.rollback()
+            return
+        for statement in split_sql(MIGRATIONS[version]):
+            db.execute(statement)
+        db.execute(f"PRAGMA user_version = {version + 1}")
+        db.commit()
+
+# ---------------- SHARDING ----------------
+# With SHARDING=1 every college's users, hostels, rooms, applications,
+# attendance and photos live in a database of their own under SHARD_DIR
+# (same schema, so every college-scoped query runs there unchanged) and
+# a write in one college never waits for another college's lock.
+#
+# The main database keeps sessions, the mail outbox, the admin account and
+# a directory of every user: a users row without password or ID card, so
+# ids, usernames, emails and phones stay unique across colleges and login
+# or password reset can find the right shard. `flask shard-database`
+# splits an existing database.db.
+
+
+def shard_filename(college):
+    digest = hashlib.sha1(college.encode()).hexdigest()[:8]
+    return f"{secure_filename(college).lower() or 'college'}-{digest}.db"
+
+
+def shard_path(college, create=False):
+    """Path of `college`'s shard; with `create` a missing shard is created
+    and registered, otherwise None is returned for it."""
+    pool = get_pool()
+    db = pool.acquire()
+    try:
+        row = db.execute("SELECT filename FROM shards WHERE college=?", (college,)).fetchone()
+        if row is None and create:
+            filename = shard_filename(college)
+            path = os.path.join(app.config["SHARD_DIR"], filename)
+            os.makedirs(app.config["SHARD_DIR"], exist_ok=True)
+            # build it aside and link it in, so racing workers never see half a schema
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            create_database(tmp).close()
+            try:
+                os.link(tmp, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.unlink(tmp)
+            db.execute("INSERT OR IGNORE INTO shards (college, filename) VALUES (?, ?)",
+                       (college, filename))
+            db.commit()
+            row = db.execute("SELECT filename FROM shards WHERE college=?", (college,)).fetchone()
+    finally:
+        pool.release(db)
+    return row and os.path.join(app.config["SHARD_DIR"], row["filename"])
+
+
+def shard_pool(college, create=False):
+    """Connection pool of `college`'s shard (migrated on first use), or None
+    when the college has no shard and `create` is not set.
+
+    Each worker keeps the SHARD_POOLS_MAX most recently used pools; an
+    evicted pool is closed, and connections it still has out are closed
+    as they come back.
+    """
+    key = (app.config["DATABASE"], college)
+    with shard_pools_lock:
+        pool = shard_pools.get(key)
+        if pool is not None:
+            shard_pools.move_to_end(key)
+            return pool
+        path = shard_path(college, create)
+        if path is None:
+            return None
+        pool = ConnectionPool(
+            path,
+            size=app.config["SHARD_POOL_SIZE"],
+            timeout=app.config["DB_POOL_TIMEOUT"],
+            recycle=app.config["DB_POOL_RECYCLE"],
+        )
+        db = pool.acquire()
+        try:
+            migrate_db(db)
+        finally:
+            pool.release(db)
+        shard_pools[key] = pool
+        while len(shard_pools) > app.config["SHARD_POOLS_MAX"]:
+            shard_pools.popitem(last=False)[1].close()
+    return pool
+
+
+shard_pools = collections.OrderedDict()
+shard_pools_lock = threading.Lock()
+
+
+def college_db(college):
+    """Connection holding `college`'s data for this app context: its shard
+    with SHARDING, otherwise (or while it has none) the main database."""
+    if not college or not app.config["SHARDING"]:
+        return main_db()
+    dbs = g.setdefault("shard_dbs", {})
+    if college not in dbs:
+        pool = shard_pool(college)
+        if pool is None:
+            return main_db()
+        dbs[college] = (pool, pool.acquire())
+        dbs[college][1].profile = g.get("profile")
+    return dbs[college][1]
+
+
+def account(user):
+    """(connection, users row) of the account behind a main-database users row.
+
+    With SHARDING the main row of a college user is only its directory
+    entry (no password) once the account has moved to the college's shard.
+    Accounts of colleges without a shard stay in full in the main database
+    until their principal is approved (move_accounts).
+    """
+    if user is None or not user["college"] or not app.config["SHARDING"] or user["password"]:
+        return main_db(), user
+    db = college_db(user["college"])
+    return db, db.execute("SELECT * FROM users WHERE id=?", (user["id"],)).fetchone()
+
+
+def move_accounts(college):
+    """SHARDING: move the accounts of `college` still held in full by the
+    main database into its shard (created if needed), leaving directory
+    entries behind. Safe to repeat after an interruption."""
+    main = main_db()
+    rows = main.execute("""
+        SELECT * FROM users WHERE college=? AND password != ''
+    """, (college,)).fetchall()
+    if not rows:
+        return
+    shard_pool(college, create=True)
+    shard = college_db(college)
+    columns = rows[0].keys()
+    shard.executemany(f"INSERT OR REPLACE INTO users ({', '.join(columns)}) "
+                      f"VALUES ({', '.join('?' * len(columns))})", map(tuple, rows))
+    shard.commit()
+    main.executemany("""
+        UPDATE users SET password='', id_card=NULL WHERE id=?
+    """, ((r["id"],) for r in rows))
+    main.commit()
+
+
+def user_copies(db, ids):
+    """With SHARDING, the other connections that hold rows of users `ids`
+    and must see the same approve/reject: the directory for a shard, the
+    users' shards for the main database."""
+    if not app.config["SHARDING"] or not ids:
+        return []
+    main = main_db()
+    if db is not main:
+        return [main]
+    shards = (college_db(r["college"]) for r in main.execute("""
+        SELECT DISTINCT college FROM users
+        WHERE id IN (SELECT value FROM json_each(?)) AND college IS NOT NULL
+    """, (json.dumps(ids),)).fetchall())
+    return [shard for shard in shards if shard is not main]
+
+# ---------------- CACHE ----------------
+app.config["CACHE_SIZE"] = 512   # fragments kept per worker
+app.config["CACHE_TTL"] = 60     # seconds before a fragment is recomputed anyway
+
+
+class FragmentCache:
+    """Small in-process LRU cache with a TTL and hit/miss counters."""
+
+    def __init__(self, maxsize=512, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def get(self, key):
+        """Cached value or None, counting a hit or a miss."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+                self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats, size=len(self._data))
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+fragment_cache = FragmentCache(app.config["CACHE_SIZE"], app.config["CACHE_TTL"])
+
+
+def cached(db, name, scope, compute):
+    """Return compute() for (name, scope), shared by every request of the scope.
+
+    Keys carry the scope's version from cache_versions, so a write that
+    calls invalidate() is seen by every worker on its next lookup.
+    """
+    version = cache_version(db, scope)
+    return fragment_cache.get_or_compute((name, scope, version), compute)
+
+
+def cache_version(db, scope):
+    row = db.execute("""
+        SELECT version FROM cache_versions WHERE scope=?
+    """, (scope,)).fetchone()
+    return row["version"] if row else 0
+
+
+def invalidate(db, scope):
+    """Bump a scope's version; call inside the write's transaction."""
+    db.execute("""
+        INSERT INTO cache_versions (scope, version) VALUES (?, 1)
+        ON CONFLICT (scope) DO UPDATE SET version = version + 1
+    """, (scope,))
+
+# ---------------- SESSIONS ----------------
+# The cookie carries only an opaque session id; the data lives server-side,
+# so it is not re-signed on every response, OTP state is shared by all
+# workers and a user's sessions can be ended at once (end_sessions).
+app.config["SESSION_BACKEND"] = os.getenv("SESSION_BACKEND", "sqlite")   # or "memory"
+app.config["SESSION_TTL"] = 12 * 3600      # idle seconds before a session expires
+app.config["SESSION_REFRESH"] = 300        # extend the expiry at most this often
+app.config["SESSION_SWEEP_INTERVAL"] = 600
+
+
+class SqliteSessionStore:
+    """Sessions in the `sessions` table, shared by every worker."""
+
+    def __init__(self):
+        self._last_sweep = 0.0
+
+    def _run(self, work):
+        # Own connection: session writes must not commit the request's work
+        pool = get_pool()
+        db = pool.acquire()
+        try:
+            result = work(db)
+            db.commit()
+            return result
+        finally:
+            pool.release(db)
+
+    def load(self, sid):
+        row = self._run(lambda db: db.execute(
+            "SELECT data, expires FROM sessions WHERE sid=? AND expires>?",
+            (sid, time.time())).fetchone())
+        return (row["data"], row["expires"]) if row else (None, 0)
+
+    def save(self, sid, uid, data, expires):
+        self._run(lambda db: db.execute("""
+            INSERT INTO sessions (sid, uid, data, expires) VALUES (?,?,?,?)
+            ON CONFLICT (sid) DO UPDATE SET uid=excluded.uid, data=excluded.data,
+                                            expires=excluded.expires
+        """, (sid, uid, data, expires)))
+
+    def touch(self, sid, expires):
+        self._run(lambda db: db.execute(
+            "UPDATE sessions SET expires=? WHERE sid=?", (expires, sid)))
+
+    def delete(self, sid):
+        self._run(lambda db: db.execute("DELETE FROM sessions WHERE sid=?", (sid,)))
+
+    def delete_user(self, uid):
+        return self._run(lambda db: db.execute(
+            "DELETE FROM sessions WHERE uid=?", (uid,)).rowcount)
+
+    def sweep(self):
+        now = time.time()
+        if now - self._last_sweep < app.config["SESSION_SWEEP_INTERVAL"]:
+            return
+        self._last_sweep = now
+        self._run(lambda db: db.execute("DELETE FROM sessions WHERE expires<?", (now,)))
+
+    def count(self):
+        return self._run(lambda db: db.execute(
+            "SELECT COUNT(*) FROM sessions WHERE expires>?", (time.time(),)).fetchone()[0])
+
+
+class MemorySessionStore:
+    """Sessions in a dict: fastest, but private to one worker process."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def load(self, sid):
+        with self._lock:
+            uid, data, expires = self._data.get(sid, (None, None, 0))
+        if expires <= time.time():
+            return None, 0
+        return data, expires
+
+    def save(self, sid, uid, data, expires):
+        with self._lock:
+            self._data[sid] = (uid, data, expires)
+
+    def touch(self, sid, expires):
+        with self._lock:
+            if sid in self._data:
+                uid, data, _ = self._data[sid]
+                self._data[sid] = (uid, data, expires)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def delete_user(self, uid):
+        with self._lock:
+            sids = [sid for sid, (owner, _, _) in self._data.items() if owner == uid]
+            for sid in sids:
+                del self._data[sid]
+        return len(sids)
+
+    def sweep(self):
+        now = time.time()
+        if now - self._last_sweep < app.config["SESSION_SWEEP_INTERVAL"]:
+            return
+        with self._lock:
+            self._last_sweep = now
+            for sid in [sid for sid, (_, _, exp) in self._data.items() if exp < now]:
+                del self._data[sid]
+
+    def count(self):
+        now = time.time()
+        with self._lock:
+            return sum(1 for _, _, exp in self._data.values() if exp > now)
+
+
+class ServerSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None, expires=0):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires = expires
+        self.loaded_uid = (initial or {}).get("uid")
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface backed by a SqliteSessionStore/MemorySessionStore."""
+
+    # Static files and uploads never read the session; skip the lookup
+    skip_prefixes = ("/static/", "/media/")
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or request.path.startswith(self.skip_prefixes):
+            return ServerSession()
+        self.store.sweep()
+        data, expires = self.store.load(sid)
+        if data is None:
+            return ServerSession()
+        return ServerSession(self.serializer.loads(data), sid, expires)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.sid and session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        expires = now + app.config["SESSION_TTL"]
+        if session.sid and session.get("uid") != session.loaded_uid:
+            # Logged in as someone else: new id, so a planted one is useless
+            self.store.delete(session.sid)
+            session.sid = None
+        if not session.sid or session.modified:
+            new = not session.sid
+            session.sid = session.sid or secrets.token_urlsafe(32)
+            self.store.save(session.sid, session.get("uid"),
+                            self.serializer.dumps(dict(session)), expires)
+            if new:
+                response.set_cookie(
+                    name, session.sid, domain=domain, path=path,
+                    httponly=self.get_cookie_httponly(app),
+                    secure=self.get_cookie_secure(app),
+                    samesite=self.get_cookie_samesite(app),
+                    expires=self.get_expiration_time(app, session),
+                )
+        elif session.expires - now < app.config["SESSION_TTL"] - app.config["SESSION_REFRESH"]:
+            self.store.touch(session.sid, expires)
+        response.vary.add("Cookie")
+
+
+def end_sessions(uid):
+    """Log a user out everywhere (password reset, rejection)."""
+    return app.session_interface.store.delete_user(uid)
+
+
+app.session_interface = ServerSessionInterface(
+    MemorySessionStore() if app.config["SESSION_BACKEND"] == "memory" else SqliteSessionStore()
+)
+
+# ---------------- INSTRUMENTATION ----------------
+# Request counts and latency are always collected for /metrics. PROFILE=1
+# additionally times every SQL statement and template render per request,
+# reports them in a Server-Timing header and cProfiles a sample of requests,
+# keeping the dumps of the slow ones in PROFILE_DIR.
+app.config["PROFILE"] = os.getenv("PROFILE", "0") == "1"
+app.config["PROFILE_SAMPLE"] = float(os.getenv("PROFILE_SAMPLE", "0.05"))   # share of requests cProfiled
+app.config["PROFILE_SLOW_MS"] = 500       # keep cProfile dumps of requests slower than this
+app.config["PROFILE_DIR"] = "profiles"
+# Scrapers without an admin login send "Authorization: Bearer <METRICS_TOKEN>".
+# METRICS_ALLOW (comma-separated client addresses) is only safe when the app
+# is reached directly: behind a reverse proxy every request comes from it.
+app.config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN", "")
+app.config["METRICS_ALLOW"] = {a.strip() for a in os.getenv("METRICS_ALLOW", "").split(",") if a.strip()}
+
+
+class TimedCursor:
+    """Cursor proxy that adds fetch time and row counts to its query record."""
+
+    def __init__(self, cursor, record):
+        self._cursor = cursor
+        self._record = record
+
+    def _timed(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._record[2] += time.perf_counter() - started
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        self._record[3] += row is not None
+        return row
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._record[3] += len(rows)
+        return rows
+
+    def fetchmany(self, size=None):
+        rows = self._timed(self._cursor.fetchmany, size or self._cursor.arraysize)
+        self._record[3] += len(rows)
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self._timed(next, self._cursor)
+        self._record[3] += 1
+        return row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class RequestProfile:
+    """SQL statements and template time of one request."""
+
+    def __init__(self):
+        self.queries = []   # [call site, sql, seconds, rows]
+        self.render_time = 0.0
+        self.render_started = None
+
+    def run(self, execute, sql, parameters):
+        caller = sys._getframe(2)
+        record = [f"{caller.f_code.co_name}:{caller.f_lineno}", " ".join(sql.split()), 0.0, 0]
+        started = time.perf_counter()
+        try:
+            cursor = execute(sql, parameters)
+        finally:
+            record[2] += time.perf_counter() - started
+            self.queries.append(record)
+        if cursor.rowcount > 0:   # executemany / DML
+            record[3] = cursor.rowcount
+        return TimedCursor(cursor, record)
+
+    @property
+    def sql_time(self):
+        return sum(q[2] for q in self.queries)
+
+
+class Metrics:
+    """Process-wide counters rendered in the Prometheus text format."""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = collections.Counter()   # (endpoint, method, status)
+        self.latency = {}                       # endpoint -> [per bucket..., sum, count]
+        self.queries = {}                       # call site -> [count, seconds, rows]
+
+    def observe(self, endpoint, method, status, seconds):
+        with self._lock:
+            self.requests[endpoint, method, status] += 1
+            hist = self.latency.setdefault(endpoint, [0] * (len(self.BUCKETS) + 2))
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+            hist[-2] += seconds
+            hist[-1] += 1
+
+    def observe_queries(self, queries):
+        with self._lock:
+            for site, _, seconds, rows in queries:
+                stats = self.queries.setdefault(site, [0, 0.0, 0])
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] += rows
+
+    def render(self, gauges):
+        def labels(**values):
+            escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            return ",".join(f'{k}="{escape(v)}"' for k, v in values.items())
+
+        lines = ["# TYPE hostel_http_requests_total counter"]
+        with self._lock:
+            for (endpoint, method, status), n in sorted(self.requests.items()):
+                lines.append(f"hostel_http_requests_total{{{labels(endpoint=endpoint, method=method, status=status)}}} {n}")
+            lines.append("# TYPE hostel_http_request_duration_seconds histogram")
+            for endpoint, hist in sorted(self.latency.items()):
+                for bound, n in zip(self.BUCKETS, hist):
+                    lines.append(f"hostel_http_request_duration_seconds_bucket{{{labels(endpoint=endpoint, le=bound)}}} {n}")
+                lines.append(f"hostel_http_request_duration_seconds_bucket{{{labels(endpoint=endpoint, le='+Inf')}}} {hist[-1]}")
+                lines.append(f"hostel_http_request_duration_seconds_sum{{{labels(endpoint=endpoint)}}} {hist[-2]:.6f}")
+                lines.append(f"hostel_http_request_duration_seconds_count{{{labels(endpoint=endpoint)}}} {hist[-1]}")
+            for name, index in (("queries", 0), ("query_seconds", 1), ("rows", 2)):
+                lines.append(f"# TYPE hostel_sql_{name}_total counter")
+                for site, stats in sorted(self.queries.items()):
+                    lines.append(f"hostel_sql_{name}_total{{{labels(site=site)}}} {stats[index]}")
+        for group, stats in gauges.items():
+            for key, value in sorted(stats.items()):
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE hostel_{group}_{key} gauge")
+                    lines.append(f"hostel_{group}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if app.config["PROFILE"]:
+        g.profile = RequestProfile()
+        if random.random() < app.config["PROFILE_SAMPLE"]:
+            import cProfile   # imported on first use: only sampled requests need it
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    profile = g.get("profile")
+    if profile is not None:
+        profile.render_started = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def stop_render_timer(sender, template, context, **extra):
+    profile = g.get("profile")
+    if profile is not None and profile.render_started is not None:
+        profile.render_time += time.perf_counter() - profile.render_started
+        profile.render_started = None
+
+
+@app.after_request
+def record_request(response):
+    started = g.get("request_started")
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    metrics.observe(request.endpoint or "none", request.method, response.status_code, elapsed)
+
+    profile = g.get("profile")
+    if profile is not None:
+        metrics.observe_queries(profile.queries)
+        response.headers["Server-Timing"] = (
+            f'sql;dur={profile.sql_time * 1000:.1f};desc="{len(profile.queries)} queries", '
+            f"tpl;dur={profile.render_time * 1000:.1f}, app;dur={elapsed * 1000:.1f}")
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            if elapsed * 1000 >= app.config["PROFILE_SLOW_MS"]:
+                save_profile(profiler, profile, elapsed)
+    return response
+
+
+@app.teardown_request
+def stop_profiler(exc):
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+
+
+def save_profile(profiler, profile, elapsed):
+    """Write <ms>_<endpoint>.prof (for pstats/snakeviz) and its queries as .sql.json."""
+    os.makedirs(app.config["PROFILE_DIR"], exist_ok=True)
+    base = os.path.join(app.config["PROFILE_DIR"],
+                        f"{int(time.time() * 1000)}_{request.endpoint}_{elapsed * 1000:.0f}ms")
+    profiler.dump_stats(base + ".prof")
+    with open(base + ".sql.json", "w") as f:
+        json.dump({
+            "path": request.full_path,
+            "elapsed": elapsed,
+            "render_time": profile.render_time,
+            "queries": [{"site": site, "sql": sql, "seconds": seconds, "rows": rows}
+                        for site, sql, seconds, rows in
+                        sorted(profile.queries, key=lambda q: q[2], reverse=True)],
+        }, f, indent=2)
+
+
+def metrics_allowed():
+    if session.get("role") == "admin" or request.remote_addr in app.config["METRICS_ALLOW"]:
+        return True
+    token = app.config["METRICS_TOKEN"]
+    sent = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    return bool(token) and secrets.compare_digest(sent.encode(), token.encode())
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    if not metrics_allowed():
+        abort(403)
+    mail = mailer.snapshot(main_db())
+    for status, depth in mail.pop("queue").items():
+        mail[f"queue_{status}"] = depth
+    gauges = {
+        "db_pool": get_pool().snapshot(),
+        "fragment_cache": fragment_cache.snapshot(),
+        "chat_cache": chat_cache.snapshot(),
+        "mail": mail,
+        "sessions": {"active": app.session_interface.store.count()},
+    }
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+# ---------------- UPLOADS ----------------
+VARIANT_FOLDER = os.path.join(UPLOAD_FOLDER, "variants")
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
+IMAGE_WIDTHS = (320, 640, 1280)   # WebP variants offered in srcset
+UPLOAD_CHUNK = 64 * 1024
+IMAGE_WORKERS = 2
+
+
+def save_upload(file, folder=UPLOAD_FOLDER):
+    """Stream an upload to `folder` under its content hash.
+
+    The file is copied in chunks while hashing, so it is never held in
+    memory; identical uploads share one copy. Image variants of public
+    uploads are generated in the background. Returns the stored filename.
+    """
+    ext = os.path.splitext(secure_filename(file.filename or ""))[1].lower()
+    digest = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK), b""):
+                digest.update(chunk)
+                out.write(chunk)
+        filename = f"{digest.hexdigest()[:32]}{ext}"
+        path = os.path.join(folder, filename)
+        if os.path.exists(path):
+            os.remove(tmp)
+        else:
+            os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    if folder == UPLOAD_FOLDER:
+        background_executor("images", IMAGE_WORKERS).submit(make_variants, filename)
+    return filename
+
+
+def variant_path(filename, width):
+    return os.path.join(VARIANT_FOLDER, f"{os.path.splitext(filename)[0]}_{width}.webp")
+
+
+def make_variants(filename):
+    """Write WebP copies of an uploaded image for every IMAGE_WIDTHS below its width."""
+    if os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+        return
+    try:
+        from PIL import Image   # imported on first use: it is slow to load
+    except ImportError:         # uploads are still stored, just without WebP variants
+        return
+    os.makedirs(VARIANT_FOLDER, exist_ok=True)
+    try:
+        with Image.open(os.path.join(UPLOAD_FOLDER, filename)) as img:
+            img.load()
+            for width in IMAGE_WIDTHS:
+                target = variant_path(filename, width)
+                if width >= img.width or os.path.exists(target):
+                    continue
+                variant = img.copy()
+                variant.thumbnail((width, img.height))
+                variant.save(target + ".part", "WEBP", quality=80)
+                os.replace(target + ".part", target)
+    except (OSError, Image.DecompressionBombError) as e:
+        print(f"Image Error: {filename}: {e}")
+
+
+def upload_url(filename, width=None):
+    """URL of an upload, or of its WebP variant of `width` once it exists."""
+    if width and os.path.exists(variant_path(filename, width)):
+        return url_for("media", filename=f"variants/{os.path.basename(variant_path(filename, width))}")
+    return url_for("media", filename=filename)
+
+
+def upload_srcset(filename):
+    """srcset listing the variants generated so far ('' until there are any)."""
+    return ", ".join(f"{upload_url(filename, w)} {w}w" for w in IMAGE_WIDTHS
+                     if os.path.exists(variant_path(filename, w)))
+
+
+app.jinja_env.globals.update(upload_url=upload_url, upload_srcset=upload_srcset)
+
+
+# Upload names are content hashes (or uuid-prefixed for older files), so a
+# URL never changes meaning and can be cached for good.
+app.config["MEDIA_MAX_AGE"] = 365 * 24 * 3600
+app.config["MEDIA_ACCEL"] = os.getenv("MEDIA_ACCEL", "")   # "", "nginx" or "sendfile"
+app.config["MEDIA_ACCEL_PREFIX"] = os.getenv("MEDIA_ACCEL_PREFIX", "/_media/")
+app.config["USE_X_SENDFILE"] = app.config["MEDIA_ACCEL"] == "sendfile"
+
+
+def send_media(folder, filename, private=False):
+    """Serve an upload with a strong ETag and immutable caching.
+
+    Conditional and Range requests are answered by send_file. With
+    MEDIA_ACCEL=nginx the body is left to the proxy via X-Accel-Redirect
+    (MEDIA_ACCEL_PREFIX + the path relative to the app); with
+    MEDIA_ACCEL=sendfile Flask emits X-Sendfile instead.
+    """
+    if app.config["MEDIA_ACCEL"] == "nginx":
+        path = safe_join(folder, filename)
+        if path is None or not os.path.isfile(os.path.join(app.root_path, path)):
+            abort(404)
+        resp = app.response_class(
+            mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+        resp.headers["X-Accel-Redirect"] = app.config["MEDIA_ACCEL_PREFIX"] + path.replace(os.sep, "/")
+    else:
+        etag = os.path.splitext(os.path.basename(filename))[0]
+        resp = send_from_directory(folder, filename, etag=etag,
+                                   max_age=app.config["MEDIA_MAX_AGE"])
+        resp.accept_ranges = "bytes"
+
+    resp.cache_control.max_age = app.config["MEDIA_MAX_AGE"]
+    resp.cache_control.public = not private
+    resp.cache_control.private = private or None
+    resp.cache_control.immutable = True
+    return resp
+
+
+@app.route("/media/<path:filename>")
+def media(filename):
+    return send_media(UPLOAD_FOLDER, filename)
+
+
+@app.route("/id_card/<int:uid>")
+def id_card(uid):
+    """A student's ID card, for themselves, their principal and the admin."""
+    role = session.get("role")
+    if not role:
+        return redirect("/")
+
+    db = get_db()
+    user = db.execute("SELECT id, id_card, college FROM users WHERE id=?", (uid,)).fetchone()
+    if role == "admin":
+        # with SHARDING the card may be in the college's shard
+        _, user = account(db.execute("SELECT * FROM users WHERE id=?", (uid,)).fetchone())
+    if not user or not user["id_card"]:
+        abort(404)
+    allowed = (session.get("uid") == uid or role == "admin"
+               or (role == "principal" and session.get("college") == user["college"]))
+    if not allowed:
+        abort(403)
+
+    # Cards uploaded before ID_CARD_FOLDER existed stay in UPLOAD_FOLDER
+    # until `flask dedupe-uploads` moves them.
+    folder = ID_CARD_FOLDER
+    if not os.path.exists(os.path.join(ID_CARD_FOLDER, user["id_card"])):
+        folder = UPLOAD_FOLDER
+    return send_media(folder, user["id_card"], private=True)
+
+# ---------------- PASSWORDS ----------------
+# A stored hash records its method ("scrypt:32768:8:1$salt$hash"), so a new
+# PASSWORD_METHOD (e.g. "pbkdf2:sha256:600000") reaches each user at their
+# next successful login.
+app.config["PASSWORD_METHOD"] = os.getenv("PASSWORD_METHOD", "scrypt:32768:8:1")
+app.config["PASSWORD_WORKERS"] = int(os.getenv("PASSWORD_WORKERS", os.cpu_count() or 1))   # concurrent hashes per process
+app.config["LOGIN_MAX_FAILURES"] = 5       # failed logins per username from one address ...
+app.config["LOGIN_MAX_FAILURES_IP"] = 20   # ... or per client address ...
+app.config["LOGIN_FAILURE_WINDOW"] = 300   # ... within this many seconds
+app.config["LOGIN_FAILURE_KEYS"] = 10000   # histories kept per worker, least recently failed dropped first
+
+login_failures = collections.OrderedDict()
+login_failures_lock = threading.Lock()
+
+
+def password_executor():
+    # hashlib's scrypt/pbkdf2 release the GIL, so these threads hash on all
+    # cores in parallel; the pool caps how much CPU a login rush can take.
+    return background_executor("passwords", app.config["PASSWORD_WORKERS"])
+
+
+def hash_password(password):
+    return password_executor().submit(
+        generate_password_hash, password, method=app.config["PASSWORD_METHOD"]).result()
+
+
+def verify_password(stored, password):
+    return password_executor().submit(check_password_hash, stored, password).result()
+
+
+@functools.lru_cache(maxsize=8)
+def password_method_prefix(method):
+    # werkzeug expands defaults, e.g. "scrypt" is stored as "scrypt:32768:8:1"
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
+
+def needs_rehash(stored):
+    return stored.split("$", 1)[0] != password_method_prefix(app.config["PASSWORD_METHOD"])
+
+
+def login_failure_keys(username):
+    # Per (username, address), so nobody can lock a known user out from elsewhere
+    return [(("user", username, request.remote_addr), app.config["LOGIN_MAX_FAILURES"]),
+            (("ip", request.remote_addr), app.config["LOGIN_MAX_FAILURES_IP"])]
+
+
+def login_throttled(keys):
+    """True once a username or address has too many recent failed logins."""
+    now = time.monotonic()
+    with login_failures_lock:
+        for key, limit in keys:
+            history = login_failures.get(key)
+            if history is None:
+                continue
+            while history and now - history[0] > app.config["LOGIN_FAILURE_WINDOW"]:
+                history.popleft()
+            if not history:
+                del login_failures[key]
+            elif len(history) >= limit:
+                return True
+    return False
+
+
+def record_login_failure(keys):
+    now = time.monotonic()
+    with login_failures_lock:
+        for key, _ in keys:
+            login_failures.setdefault(key, collections.deque()).append(now)
+            login_failures.move_to_end(key)
+        # Sprayed usernames/addresses must not grow this without bound
+        while len(login_failures) > app.config["LOGIN_FAILURE_KEYS"]:
+            login_failures.popitem(last=False)
+
 # ---------------- LOGIN ----------------
 @app.route("/", methods=["GET","POST"])
 def login():
@@ -53,11 +1544,22 @@ def login():
         u = request.form["username"]
         p = request.form["password"]
 
-        db = get_db()
-        user = db.execute("SELECT * FROM users WHERE username=?", (u,)).fetchone()
-        db.close()
+        # Refuse floods before spending any CPU on hashing
+        keys = login_failure_keys(u)
+        if login_throttled(keys):
+            flash("Too many failed attempts. Try again in a few minutes.")
+            return render_template("login.html"), 429
+
+        db, user = account(main_db().execute(
+            "SELECT * FROM users WHERE username=?", (u,)).fetchone())
+
+        if user and verify_password(user["password"], p):
+            with login_failures_lock:
+                login_failures.pop(("user", u, request.remote_addr), None)
+            if needs_rehash(user["password"]):
+                db.execute("UPDATE users SET password=? WHERE id=?", (hash_password(p), user["id"]))
+                db.commit()
 
-        if user and check_password_hash(user["password"], p):
             if user["approved"] == 0:
                 flash("Account waiting for approval")
                 return redirect("/")
@@ -68,6 +1570,7 @@ def login():
             session["username"] = user["username"]
             return redirect(f"/{user['role']}")
 
+        record_login_failure(keys)
         flash("Invalid credentials")
     return render_template("login.html")
 
@@ -81,40 +1584,47 @@ def logout():
 def register(role):
     if request.method == "POST":
         username = request.form["username"]
-        password = generate_password_hash(request.form["password"])
+        password = hash_password(request.form["password"])
         college = request.form.get("college")
         email = request.form.get("email")
         phone = request.form.get("phone")
 
-        id_card = None
-        if role == "student":
-            file = request.files["id_card"]
-            id_card = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
-            file.save(os.path.join(UPLOAD_FOLDER, id_card))
-
-        db = get_db()
+        db = main_db()
         try:
-            db.execute("""
+            uid = db.execute("""
                 INSERT INTO users
-                (username, password, email, phone, role, college, id_card, approved)
-                VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+                (username, password, email, phone, role, college, approved)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
             """, (
                 username,
                 password,
                 email,
                 phone,
                 role,
-                college,
-                id_card
-            ))
-            db.commit()
+                college
+            )).lastrowid
 
         except IntegrityError as e:
-            db.close()
+            db.rollback()
             flash("Username / Email / Phone already exists")
             return redirect(f"/register/{role}")
 
-        db.close()
+        # The ID card is only stored once the account is known to be new,
+        # so a rejected duplicate never leaves a file behind
+        if role == "student":
+            try:
+                id_card = save_upload(request.files["id_card"], ID_CARD_FOLDER)
+            except BaseException:
+                db.rollback()
+                raise
+            db.execute("UPDATE users SET id_card=? WHERE id=?", (id_card, uid))
+        db.commit()
+
+        # SHARDING: a college that already has a shard gets the account now;
+        # a new college's shard is only created once its principal is approved
+        if app.config["SHARDING"] and college and shard_pool(college):
+            move_accounts(college)
+
         flash("Registered successfully. Wait for principal approval.")
         return redirect("/")
 
@@ -128,8 +1638,140 @@ def debug_users():
         SELECT id, username, role, college, approved
         FROM users
     """).fetchall()
-    db.close()
     return "<br>".join([str(dict(u)) for u in users])
+
+@app.route("/debug_db")
+def debug_db():
+    if session.get("role") != "admin":
+        return redirect("/")
+    return {**get_pool().snapshot(), "sessions": app.session_interface.store.count(),
+            "shards": {college: pool.snapshot() for (_, college), pool in shard_pools.items()}}
+
+@app.route("/debug_cache")
+def debug_cache():
+    if session.get("role") != "admin":
+        return redirect("/")
+    return {"fragments": fragment_cache.snapshot(), "chat": chat_cache.snapshot()}
+# ---------------- APPROVAL QUEUES ----------------
+APPROVAL_PAGE_SIZE = 50
+
+
+def queue_page_args(args):
+    """(after id, limit) of an approval queue page; pages are keyed on users.id."""
+    after = args.get("after", 0, type=int) or 0
+    limit = max(1, min(args.get("limit", APPROVAL_PAGE_SIZE, type=int) or APPROVAL_PAGE_SIZE,
+                       APPROVAL_PAGE_SIZE * 10))
+    return after, limit
+
+
+def pending_principals(db, args):
+    after, limit = queue_page_args(args)
+    rows = db.execute("""
+        SELECT id, username, college, email, phone, created_at
+        FROM users
+        WHERE role='principal' AND approved=0 AND id > ?
+        ORDER BY id
+        LIMIT ?
+    """, (after, limit + 1)).fetchall()
+    return rows[:limit], rows[limit - 1]["id"] if len(rows) > limit else None
+
+
+def pending_college_users(db, college, args):
+    """One page of the students, wardens and guardians of `college` awaiting approval."""
+    after, limit = queue_page_args(args)
+    rows = db.execute("""
+        SELECT id, username, role, email, phone, id_card, created_at
+        FROM users
+        WHERE approved=0 AND college=? AND role IN ('student','warden','guardian') AND id > ?
+        ORDER BY id
+        LIMIT ?
+    """, (college, after, limit + 1)).fetchall()
+    return rows[:limit], rows[limit - 1]["id"] if len(rows) > limit else None
+
+
+def queue_decisions():
+    """(approve ids, reject ids) from the queue form or JSON.
+
+    Form: uid=<id> checkboxes plus action=approve|reject.
+    JSON: {"approve": [3, 4], "reject": [5]}
+    """
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        approve, reject = data.get("approve") or [], data.get("reject") or []
+    elif request.form.get("action") == "approve":
+        approve, reject = request.form.getlist("uid"), []
+    else:
+        approve, reject = [], request.form.getlist("uid")
+
+    def ids(values):
+        return sorted({int(v) for v in values if str(v).isdigit()})
+
+    approve = ids(approve)
+    return approve, [uid for uid in ids(reject) if uid not in approve]
+
+
+def decide_college_users(db, college, approve, reject):
+    """Apply a batch of decisions on a college's queue in one transaction.
+
+    Only pending students, wardens and guardians of `college` are touched.
+    Returns (approved, rejected) counts.
+    """
+    counts = None
+    for conn in [db, *user_copies(db, approve + reject)]:
+        approved = conn.executemany("""
+            UPDATE users SET approved=1
+            WHERE id=? AND college=? AND approved=0 AND role IN ('student','warden','guardian')
+        """, ((uid, college) for uid in approve)).rowcount
+        rejected = conn.executemany("""
+            DELETE FROM users
+            WHERE id=? AND college=? AND approved=0 AND role IN ('student','warden','guardian')
+        """, ((uid, college) for uid in reject)).rowcount
+        invalidate(conn, college)
+        conn.commit()
+        counts = counts or (max(approved, 0), max(rejected, 0))
+    end_rejected_sessions(db, reject)
+    return counts
+
+
+def end_rejected_sessions(db, reject):
+    """Log out everywhere the rejected users whose rows are now gone."""
+    for (uid,) in db.execute("""
+        SELECT value FROM json_each(?) AS r
+        WHERE NOT EXISTS (SELECT 1 FROM users WHERE id = r.value)
+    """, (json.dumps(reject),)).fetchall():
+        end_sessions(uid)
+
+
+def decide_principals(db, approve, reject):
+    """Batch counterpart of decide_college_users for the admin's queue."""
+    counts = None
+    for conn in [db, *user_copies(db, approve + reject)]:
+        approved = conn.executemany("""
+            UPDATE users SET approved=1 WHERE id=? AND role='principal' AND approved=0
+        """, ((uid,) for uid in approve)).rowcount
+        rejected = conn.executemany("""
+            DELETE FROM users WHERE id=? AND role='principal' AND approved=0
+        """, ((uid,) for uid in reject)).rowcount
+        invalidate(conn, "principals")
+        conn.commit()
+        counts = counts or (max(approved, 0), max(rejected, 0))
+    end_rejected_sessions(db, reject)
+    if app.config["SHARDING"] and approve:
+        # an approved principal's college gets its shard (and accounts) now
+        for (college,) in db.execute("""
+            SELECT DISTINCT college FROM users
+            WHERE id IN (SELECT value FROM json_each(?)) AND approved=1 AND college IS NOT NULL
+        """, (json.dumps(approve),)).fetchall():
+            move_accounts(college)
+    return counts
+
+
+def decision_response(approved, rejected, dashboard):
+    if request.is_json:
+        return {"approved": approved, "rejected": rejected}
+    flash(f"{approved} approved, {rejected} rejected")
+    return redirect(dashboard)
+
 # ---------------- ADMIN ----------------
 @app.route("/admin")
 def admin():
@@ -137,20 +1779,17 @@ def admin():
         return redirect("/")
 
     db = get_db()
-    principals = db.execute("""
-        SELECT * FROM users WHERE role='principal' AND approved=0
-    """).fetchall()
+    principals, next_after = pending_principals(db, request.args)
 
-    approved_principals = db.execute("""
-        SELECT * FROM users WHERE role='principal' AND approved=1
-    """).fetchall()
+    approved_principals = cached(db, "approved_principals", "principals", lambda: db.execute("""
+        SELECT id, username, college, email, phone FROM users WHERE role='principal' AND approved=1
+    """).fetchall())
 
-    college_count = db.execute("""
+    college_count = cached(db, "college_count", "principals", lambda: db.execute("""
         SELECT COUNT(DISTINCT college) FROM users WHERE role='principal' AND approved=1
-    """).fetchone()[0]
+    """).fetchone()[0])
 
-    db.close()
-    return render_template("admin_dashboard.html", principals=principals,
+    return render_template("admin_dashboard.html", principals=principals, next_after=next_after,
                            approved_principals=approved_principals, college_count=college_count)
 
 @app.route("/admin/approve/<int:uid>")
@@ -158,33 +1797,39 @@ def admin_approve(uid):
     if session.get("role") != "admin":
         return redirect("/")
 
-    db = get_db()
-    db.execute("UPDATE users SET approved=1 WHERE id=?", (uid,))
-    db.commit()
-    db.close()
+    decide_principals(get_db(), [uid], [])
     return redirect("/admin")
 
 
+@app.route("/admin/principals/decide", methods=["POST"])
+def admin_decide_principals():
+    if session.get("role") != "admin":
+        return redirect("/")
+
+    approve, reject = queue_decisions()
+    return decision_response(*decide_principals(get_db(), approve, reject), "/admin")
+
+
 # ---------------- PRINCIPAL DASHBOARD ----------------
 @app.route("/principal")
-def principal():
+def principal(report=None):
     if session.get("role") != "principal":
         return redirect("/")
 
     db = get_db()
 
-    # Pending students & wardens of this college
-    pending_users = db.execute("""
-    SELECT * FROM users
-    WHERE role IN ('student','warden')
-    AND approved=0
-""").fetchall()
+    # Pending students, wardens & guardians of this college (one page)
+    pending_users, next_after = pending_college_users(db, session["college"], request.args)
+    pending_total = db.execute("""
+        SELECT COUNT(*) FROM users
+        WHERE approved=0 AND college=? AND role IN ('student','warden','guardian')
+    """, (session["college"],)).fetchone()[0]
 
     # Count total approved students in this college
-    student_count = db.execute("""
+    student_count = cached(db, "student_count", session["college"], lambda: db.execute("""
         SELECT COUNT(*) FROM users 
         WHERE role='student' AND college=? AND approved=1
-    """, (session["college"],)).fetchone()[0]
+    """, (session["college"],)).fetchone()[0])
 
     # Pending hostel applications (students only)
     applications = db.execute("""
@@ -197,11 +1842,20 @@ def principal():
         AND u.college=?
     """, (session["college"],)).fetchall()
 
-    db.close()
+    # Attendance health of the college (from the summary tables)
+    summary = college_attendance_summary(db, session["college"])
+    defaulters = [r for r in summary if r["percentage"] < DEFAULTER_THRESHOLD]
+    daily_rates = college_daily_rates(db, session["college"], 7)
+
     return render_template("principal_dashboard.html",
                            students=pending_users,
+                           next_after=next_after,
+                           pending_total=pending_total,
                            apps=applications,
-                           student_count=student_count)
+                           student_count=student_count,
+                           defaulters=defaulters,
+                           daily_rates=daily_rates,
+                           report=report)
 
 # ---------------- APPROVE STUDENT/WARDEN ----------------
 @app.route("/principal/approve_user/<int:uid>")
@@ -209,10 +1863,7 @@ def principal_approve_user(uid):
     if session.get("role") != "principal":
         return redirect("/")
 
-    db = get_db()
-    db.execute("UPDATE users SET approved=1 WHERE id=?", (uid,))
-    db.commit()
-    db.close()
+    decide_college_users(get_db(), session["college"], [uid], [])
     flash("User approved successfully")
     return redirect("/principal")
 
@@ -222,70 +1873,234 @@ def principal_reject_user(uid):
     if session.get("role") != "principal":
         return redirect("/")
 
-    db = get_db()
-    db.execute("DELETE FROM users WHERE id=?", (uid,))
-    db.commit()
-    db.close()
+    decide_college_users(get_db(), session["college"], [], [uid])
     flash("User rejected successfully")
     return redirect("/principal")
 
-# ---------------- APPROVE HOSTEL APPLICATION ----------------
+
+@app.route("/principal/users/decide", methods=["POST"])
+def principal_decide_users():
+    if session.get("role") != "principal":
+        return redirect("/")
+
+    approve, reject = queue_decisions()
+    return decision_response(
+        *decide_college_users(get_db(), session["college"], approve, reject), "/principal")
+
+# ---------------- APPROVE HOSTEL APPLICATION ----------------
+def immediate_transaction(db, work, retries=5):
+    """Run work(db) inside BEGIN IMMEDIATE, retrying while the DB is busy.
+
+    Taking the write lock up front means every read inside work() sees
+    data no other writer can change before we commit.
+    """
+    for attempt in range(retries):
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            result = work(db)
+            db.commit()
+            return result
+        except sqlite3.OperationalError as e:
+            if db.in_transaction:
+                db.rollback()
+            busy = "locked" in str(e) or "busy" in str(e)
+            if not busy or attempt == retries - 1:
+                raise
+            time.sleep(random.uniform(0.01, 0.05) * 2 ** attempt)
+        except BaseException:
+            if db.in_transaction:
+                db.rollback()
+            raise
+
+
+def reserve_bed(db, hostel_id, preferred_room=None):
+    """Take one bed, preferring the requested room; return the room id or None.
+
+    Each reservation is a conditional UPDATE checked by rowcount, so a
+    room can never go past capacity even if its row changed since it was
+    read.
+    """
+    candidates = []
+    if preferred_room is not None:
+        candidates.append(preferred_room)
+    candidates += [r["id"] for r in db.execute("""
+        SELECT id FROM rooms
+        WHERE hostel_id=? AND occupied < capacity
+        ORDER BY id
+        LIMIT 5
+    """, (hostel_id,))]
+
+    for room_id in candidates:
+        cur = db.execute("""
+            UPDATE rooms
+            SET occupied = occupied + 1
+            WHERE id=? AND hostel_id=? AND occupied < capacity
+        """, (room_id, hostel_id))
+        if cur.rowcount == 1:
+            return room_id
+    return None
+
+
+def allocate_room(db, aid, college):
+    """Approve a pending application of `college`, reserving a bed atomically.
+
+    Returns ("approved", room_id), ("full", None) when the hostel has no
+    free bed (the application stays pending), or ("missing", None).
+    """
+    def work(db):
+        app_data = db.execute("""
+            SELECT a.student_id, a.hostel_id, a.room_id
+            FROM applications a
+            JOIN users u ON a.student_id = u.id
+            WHERE a.id=? AND a.status='pending' AND u.college=?
+        """, (aid, college)).fetchone()
+        if not app_data:
+            return "missing", None
+
+        # 1. Try the room applied for, 2. fall back to any free room
+        room_id = reserve_bed(db, app_data["hostel_id"], app_data["room_id"])
+        if room_id is None:
+            return "full", None
+
+        db.execute("""
+            UPDATE users
+            SET room_id=?
+            WHERE id=?
+        """, (room_id, app_data["student_id"]))
+
+        db.execute("""
+            UPDATE applications
+            SET status='approved'
+            WHERE id=?
+        """, (aid,))
+        invalidate(db, college)
+        return "approved", room_id
+
+    return immediate_transaction(db, work)
+
+
 @app.route("/principal/approve_hostel/<int:aid>")
 def principal_approve_hostel(aid):
     if session.get("role") != "principal":
         return redirect("/")
 
-    db = get_db()
-    app_data = db.execute("""
-        SELECT student_id, hostel_id, room_id
-        FROM applications
-        WHERE id=?
-    """, (aid,)).fetchone()
-
-    if app_data:
-        # 1. Try to allocate the specific room applied for
-        room = db.execute("""
-            SELECT id FROM rooms
-            WHERE id=? AND occupied < capacity
-        """, (app_data["room_id"],)).fetchone()
-
-        # 2. If that room is full, fallback to any available room in the hostel
-        if not room:
-            room = db.execute("""
-                SELECT id FROM rooms
-                WHERE hostel_id=? AND occupied < capacity
-                LIMIT 1
-            """, (app_data["hostel_id"],)).fetchone()
-
-        if room:
-            db.execute("""
-                UPDATE rooms
-                SET occupied = occupied + 1
-                WHERE id=?
-            """, (room["id"],))
+    status, _ = allocate_room(get_db(), aid, session["college"])
 
-            db.execute("""
-                UPDATE users
-                SET room_id=?
-                WHERE id=?
-            """, (room["id"], app_data["student_id"]))
+    if status == "approved":
+        flash("Hostel request approved")
+    elif status == "full":
+        flash("No free beds left in this hostel")
+    else:
+        flash("Application not found or already processed")
+    return redirect("/principal")
 
-            db.execute("""
-                UPDATE hostels
-                SET available_rooms = available_rooms - 1
-                WHERE id=?
-            """, (app_data["hostel_id"],))
+# ---------------- BATCH ALLOTMENT ----------------
+def allocate_pending(db, college):
+    """Allot rooms to every pending application of a college in one pass.
 
-        db.execute("""
+    Applications are served first come, first served. Each gets its
+    requested room if it still has a bed, otherwise the first room with a
+    free bed in the same hostel. Free beds are tracked in memory per
+    hostel and everything is committed in one transaction. Returns one
+    report row per application with outcome "preferred", "fallback",
+    "unallocated" or "duplicate" (the student already has a room, or got
+    one earlier in this run); duplicates are rejected in the same
+    transaction so a later run cannot hand out a second bed.
+    """
+    def work(db):
+        applications = db.execute("""
+            SELECT a.id, a.student_id, a.hostel_id, a.room_id, u.username,
+                   u.room_id AS current_room
+            FROM applications a
+            JOIN users u ON a.student_id = u.id
+            WHERE a.status='pending' AND u.college=?
+            ORDER BY a.created_at, a.id
+        """, (college,)).fetchall()
+
+        rooms = db.execute("""
+            SELECT r.id, r.hostel_id, r.room_number, r.capacity - r.occupied AS free,
+                   h.name AS hostel_name
+            FROM rooms r
+            JOIN hostels h ON r.hostel_id = h.id
+            WHERE h.college=? AND r.occupied < r.capacity
+            ORDER BY r.id
+        """, (college,)).fetchall()
+
+        free = {r["id"]: r["free"] for r in rooms}
+        labels = {r["id"]: (r["hostel_name"], r["room_number"]) for r in rooms}
+        room_hostel = {r["id"]: r["hostel_id"] for r in rooms}
+        open_rooms = {}  # hostel_id -> rooms that may still have a bed, in order
+        for r in rooms:
+            open_rooms.setdefault(r["hostel_id"], collections.deque()).append(r["id"])
+
+        taken = collections.Counter()
+        allotted, report = set(), []
+        for a in applications:
+            room_id = a["room_id"]
+            if a["student_id"] in allotted or a["current_room"] is not None:
+                outcome, room_id = "duplicate", None
+            elif free.get(room_id, 0) > 0 and room_hostel[room_id] == a["hostel_id"]:
+                outcome = "preferred"
+            else:
+                candidates = open_rooms.get(a["hostel_id"], ())
+                while candidates and free[candidates[0]] == 0:
+                    candidates.popleft()
+                room_id = candidates[0] if candidates else None
+                outcome = "fallback" if room_id else "unallocated"
+
+            if room_id:
+                free[room_id] -= 1
+                taken[room_id] += 1
+                allotted.add(a["student_id"])
+            hostel, room = labels.get(room_id, (None, None))
+            report.append({"application_id": a["id"], "student_id": a["student_id"],
+                           "username": a["username"], "outcome": outcome,
+                           "room_id": room_id, "hostel": hostel, "room": room})
+
+        cur = db.executemany("""
+            UPDATE rooms
+            SET occupied = occupied + ?
+            WHERE id=? AND occupied + ? <= capacity
+        """, ((n, room_id, n) for room_id, n in taken.items()))
+        if cur.rowcount != len(taken):
+            raise RuntimeError("room capacity changed during batch allotment")
+
+        placed = [r for r in report if r["outcome"] in ("preferred", "fallback")]
+        db.executemany("""
+            UPDATE users
+            SET room_id=?
+            WHERE id=?
+        """, ((r["room_id"], r["student_id"]) for r in placed))
+        db.executemany("""
             UPDATE applications
             SET status='approved'
             WHERE id=?
-        """, (aid,))
+        """, ((r["application_id"],) for r in placed))
+        db.executemany("""
+            UPDATE applications
+            SET status='rejected'
+            WHERE id=? AND status='pending'
+        """, ((r["application_id"],) for r in report if r["outcome"] == "duplicate"))
+        if placed:
+            invalidate(db, college)
+        return report
 
-    db.commit()
-    db.close()
-    flash("Hostel request approved")
-    return redirect("/principal")
+    return immediate_transaction(db, work)
+
+
+@app.route("/principal/allocate_all", methods=["POST"])
+def principal_allocate_all():
+    if session.get("role") != "principal":
+        return redirect("/")
+
+    report = allocate_pending(get_db(), session["college"])
+
+    if request.is_json or request.accept_mimetypes.best == "application/json":
+        return {"report": report}
+    counts = collections.Counter(r["outcome"] for r in report)
+    flash(f"Batch allotment: {counts['preferred']} preferred, "
+          f"{counts['fallback']} fallback, {counts['unallocated']} without a room")
+    return principal(report=report)
 
 # ---------------- STUDENT ----------------
 
@@ -296,30 +2111,26 @@ def student():
 
     db = get_db()
 
-    # Available rooms (not allocated)
-    rooms = db.execute("""
-        SELECT r.*, h.name AS hostel_name
-        FROM rooms r
-        JOIN hostels h ON r.hostel_id = h.id
-        WHERE h.college = ?
-    """, (session["college"],)).fetchall()
+    # Room search (first page; "More rooms" follows the after= cursor)
+    rooms = search_rooms(db, session["college"], request.args)
+    more_rooms = None
+    if rooms["next"]:
+        args = request.args.copy()
+        args["after"] = rooms["next"]
+        more_rooms = "?" + urllib.parse.urlencode(list(args.items(multi=True))) + "#rooms"
 
-    # Student attendance
-    attendance = db.execute("""
-        SELECT date, status
-        FROM attendance
-        WHERE student_id = ?
-        ORDER BY date DESC
-    """, (session["uid"],)).fetchall()
+    # Student attendance (first page, the rest is fetched on scroll)
+    attendance, next_cursor = attendance_page(db, request.args)
+    summary = student_attendance_summary(db, session["uid"])
 
     # Photos (room-wise)
-    photos = db.execute("""
+    photos = cached(db, "photos", session["college"], lambda: db.execute("""
         SELECT rp.filename, r.room_number, h.name AS hostel_name
         FROM room_photos rp
         JOIN rooms r ON rp.room_id = r.id
         JOIN hostels h ON rp.hostel_id = h.id
         WHERE h.college = ?
-    """, (session["college"],)).fetchall()
+    """, (session["college"],)).fetchall())
 
     # Allocated room (if already approved)
     room = db.execute("""
@@ -330,12 +2141,13 @@ def student():
         WHERE u.id = ?
     """, (session["uid"],)).fetchone()
 
-    db.close()
-
     return render_template(
         "student_dashboard.html",
         rooms=rooms,
+        more_rooms=more_rooms,
         attendance=attendance,
+        next_cursor=next_cursor,
+        summary=summary,
         photos=photos,
         room=room
     )
@@ -359,10 +2171,217 @@ def apply_room(room_id):
         """, (session["uid"], hostel["hostel_id"], room_id))
 
     db.commit()
-    db.close()
 
     flash("Room application sent to principal")
     return redirect("/student")
+# ---------------- ROOM SEARCH ----------------
+# rooms_fts and room_tags (migration 11) follow rooms and hostels through
+# triggers, so searching never reads the free-text columns themselves.
+ROOM_PAGE_SIZE = 24
+ROOM_SORTS = ("relevance", "free", "hostel")
+ROOM_FREE_BUCKETS = (1, 2, 3)   # "at least n free beds" facet
+ROOM_TAG_FACETS = 12            # facility tags offered as filters
+
+
+def room_match_query(text):
+    """FTS5 query for user text: every word must match, as a prefix."""
+    words = re.findall(r"\w+", text.lower())
+    return " ".join(f'"{w}"*' for w in words) or None
+
+
+def room_search_args(args):
+    """Normalise the search args: q, hostel, min_free, tag (repeatable), sort,
+    after (cursor) and limit."""
+    match = room_match_query(args.get("q", ""))
+    sort = args.get("sort", "")
+    if sort not in ROOM_SORTS or (sort == "relevance" and not match):
+        sort = "relevance" if match else "hostel"
+    tags = sorted({t.strip().lower() for t in args.getlist("tag") if t.strip()})
+
+    # (sort key, id) cursor; the key's type depends on the sort
+    after_key = after_id = None
+    key, _, last_id = args.get("after", "").rpartition("|")
+    if last_id.isdigit():
+        try:
+            after_key = {"free": int, "relevance": float}.get(sort, str)(key)
+            after_id = int(last_id)
+        except ValueError:
+            pass
+
+    limit = max(1, min(args.get("limit", ROOM_PAGE_SIZE, type=int) or ROOM_PAGE_SIZE,
+                       ROOM_PAGE_SIZE * 4))
+    return {"match": match, "sort": sort, "tags": tags,
+            "hostel": args.get("hostel", type=int),
+            "min_free": max(args.get("min_free", 0, type=int) or 0, 0),
+            "after_key": after_key, "after_id": after_id, "limit": limit}
+
+
+def search_rooms(db, college, args):
+    """One keyset page of a college's rooms plus facet counts.
+
+    Text goes through rooms_fts; hostel, free beds and facility tags
+    (all tags must be present) filter the hits. Sorts: relevance (bm25,
+    text searches only), free (most free beds first) and hostel (name,
+    then room order). Facets are counted over the hits without the hostel
+    and free-bed filters, so every option shows what choosing it would
+    give; they are cached per college until its rooms change.
+    """
+    a = room_search_args(args)
+    tags = json.dumps(a["tags"])
+    filters = (a["hostel"], a["hostel"], a["min_free"],
+               len(a["tags"]), tags, len(a["tags"]))
+    after = (a["after_key"], a["after_key"], a["after_id"])
+
+    if a["match"]:
+        rows = db.execute("""
+            WITH hits AS (
+                SELECT r.id, r.room_number, r.capacity, r.occupied, r.facilities, r.damage,
+                       h.id AS hostel_id, h.name AS hostel_name,
+                       r.capacity - r.occupied AS free,
+                       CASE ? WHEN 'free' THEN r.occupied - r.capacity
+                              WHEN 'hostel' THEN h.name
+                              ELSE bm25(rooms_fts) END AS sort_key
+                FROM rooms_fts
+                JOIN rooms r ON r.id = rooms_fts.rowid
+                JOIN hostels h ON h.id = r.hostel_id
+                WHERE rooms_fts MATCH ? AND h.college = ?
+                AND (? IS NULL OR h.id = ?)
+                AND r.capacity - r.occupied >= ?
+                AND (? = 0 OR (SELECT COUNT(*) FROM room_tags t
+                               WHERE t.room_id = r.id
+                               AND t.tag IN (SELECT value FROM json_each(?))) = ?)
+            )
+            SELECT * FROM hits
+            WHERE ? IS NULL OR (sort_key, id) > (?, ?)
+            ORDER BY sort_key, id
+            LIMIT ?
+        """, (a["sort"], a["match"], college, *filters, *after, a["limit"] + 1)).fetchall()
+    else:
+        rows = db.execute("""
+            WITH hits AS (
+                SELECT r.id, r.room_number, r.capacity, r.occupied, r.facilities, r.damage,
+                       h.id AS hostel_id, h.name AS hostel_name,
+                       r.capacity - r.occupied AS free,
+                       CASE ? WHEN 'free' THEN r.occupied - r.capacity
+                              ELSE h.name END AS sort_key
+                FROM hostels h
+                JOIN rooms r ON r.hostel_id = h.id
+                WHERE h.college = ?
+                AND (? IS NULL OR h.id = ?)
+                AND r.capacity - r.occupied >= ?
+                AND (? = 0 OR (SELECT COUNT(*) FROM room_tags t
+                               WHERE t.room_id = r.id
+                               AND t.tag IN (SELECT value FROM json_each(?))) = ?)
+            )
+            SELECT * FROM hits
+            WHERE ? IS NULL OR (sort_key, id) > (?, ?)
+            ORDER BY sort_key, id
+            LIMIT ?
+        """, (a["sort"], college, *filters, *after, a["limit"] + 1)).fetchall()
+
+    next_cursor = None
+    if len(rows) > a["limit"]:
+        rows = rows[:a["limit"]]
+        next_cursor = f"{rows[-1]['sort_key']}|{rows[-1]['id']}"
+
+    facet_key = ("room_facets", a["match"], a["hostel"], a["min_free"], tags)
+    facets = cached(db, facet_key, college, lambda: room_facets(db, college, a))
+    items = [{k: r[k] for k in r.keys() if k != "sort_key"} for r in rows]
+    return dict(facets, items=items, next=next_cursor, sort=a["sort"])
+
+
+def room_facets(db, college, a):
+    """Counts per hostel, per free-bed bucket and per facility tag."""
+    tags = json.dumps(a["tags"])
+    params = (len(a["tags"]), tags, len(a["tags"]),
+              a["hostel"], a["hostel"], a["hostel"], a["hostel"], a["min_free"],
+              a["hostel"], a["hostel"], a["min_free"])
+    # CROSS JOIN keeps hits as the outer loop: one room_tags probe per hit
+    if a["match"]:
+        rows = db.execute("""
+            WITH hits AS (
+                SELECT r.id, h.id AS hostel_id, h.name AS hostel_name,
+                       r.capacity - r.occupied AS free
+                FROM rooms_fts
+                JOIN rooms r ON r.id = rooms_fts.rowid
+                JOIN hostels h ON h.id = r.hostel_id
+                WHERE rooms_fts MATCH ? AND h.college = ?
+                AND (? = 0 OR (SELECT COUNT(*) FROM room_tags t
+                               WHERE t.room_id = r.id
+                               AND t.tag IN (SELECT value FROM json_each(?))) = ?)
+            )
+            SELECT 'hostel' AS facet, hostel_id AS value, hostel_name AS label, COUNT(*) AS n
+            FROM hits GROUP BY hostel_id
+            UNION ALL
+            SELECT 'free', MIN(free, 3), NULL, COUNT(*)
+            FROM hits WHERE free > 0 AND (? IS NULL OR hostel_id = ?) GROUP BY 2
+            UNION ALL
+            SELECT 'total', NULL, NULL, COUNT(*)
+            FROM hits WHERE (? IS NULL OR hostel_id = ?) AND free >= ?
+            UNION ALL
+            SELECT 'tag', t.tag, NULL, COUNT(*)
+            FROM hits CROSS JOIN room_tags t ON t.room_id = hits.id
+            WHERE (? IS NULL OR hits.hostel_id = ?) AND hits.free >= ?
+            GROUP BY t.tag
+        """, (a["match"], college, *params)).fetchall()
+    else:
+        rows = db.execute("""
+            WITH hits AS (
+                SELECT r.id, h.id AS hostel_id, h.name AS hostel_name,
+                       r.capacity - r.occupied AS free
+                FROM hostels h
+                JOIN rooms r ON r.hostel_id = h.id
+                WHERE h.college = ?
+                AND (? = 0 OR (SELECT COUNT(*) FROM room_tags t
+                               WHERE t.room_id = r.id
+                               AND t.tag IN (SELECT value FROM json_each(?))) = ?)
+            )
+            SELECT 'hostel' AS facet, hostel_id AS value, hostel_name AS label, COUNT(*) AS n
+            FROM hits GROUP BY hostel_id
+            UNION ALL
+            SELECT 'free', MIN(free, 3), NULL, COUNT(*)
+            FROM hits WHERE free > 0 AND (? IS NULL OR hostel_id = ?) GROUP BY 2
+            UNION ALL
+            SELECT 'total', NULL, NULL, COUNT(*)
+            FROM hits WHERE (? IS NULL OR hostel_id = ?) AND free >= ?
+            UNION ALL
+            SELECT 'tag', t.tag, NULL, COUNT(*)
+            FROM hits CROSS JOIN room_tags t ON t.room_id = hits.id
+            WHERE (? IS NULL OR hits.hostel_id = ?) AND hits.free >= ?
+            GROUP BY t.tag
+        """, (college, *params)).fetchall()
+
+    hostels, free, tags, total = [], collections.Counter(), [], 0
+    for r in rows:
+        if r["facet"] == "hostel":
+            hostels.append({"value": r["value"], "label": r["label"], "count": r["n"]})
+        elif r["facet"] == "free":
+            free[r["value"]] = r["n"]
+        elif r["facet"] == "tag":
+            tags.append({"value": r["value"], "count": r["n"]})
+        else:
+            total = r["n"]
+    hostels.sort(key=lambda f: f["label"])
+    tags = heapq.nlargest(ROOM_TAG_FACETS, tags, key=lambda f: (f["count"], f["value"]))
+    # selected tags stay visible even when they are not among the top ones
+    tags += [{"value": t, "count": total} for t in a["tags"]
+             if t not in {f["value"] for f in tags}]
+    return {"total": total, "facets": {
+        "hostel": hostels,
+        "free": [{"value": n, "count": sum(c for b, c in free.items() if b >= n)}
+                 for n in ROOM_FREE_BUCKETS],
+        "tag": tags,
+    }}
+
+
+@app.route("/rooms/search")
+def rooms_search():
+    """JSON room search for the caller's college; see search_rooms()."""
+    if session.get("role") not in ("student", "warden", "principal"):
+        return {"error": "Please login first!"}, 401
+
+    return search_rooms(get_db(), session["college"], request.args)
+
 # ---------------- WARDEN DASHBOARD ----------------
 @app.route("/warden")
 def warden():
@@ -378,14 +2397,8 @@ def warden():
         WHERE role='student' AND approved=1 AND college=?
     """, (session["college"],)).fetchall()
 
-    # Attendance taken by this warden
-    attendance = db.execute("""
-        SELECT u.username, a.date, a.status
-        FROM attendance a
-        JOIN users u ON a.student_id = u.id
-        WHERE a.warden_id=?
-        ORDER BY a.date DESC
-    """, (session["uid"],)).fetchall()
+    # Attendance taken by this warden (first page)
+    attendance, next_cursor = attendance_page(db, request.args)
 
     # Hostels created by this warden
     hostels = db.execute("""
@@ -410,122 +2423,813 @@ def warden():
         WHERE rp.warden_id=? AND h.college=?
     """, (session["uid"], session["college"])).fetchall()
 
-    db.close()
+    return render_template(
+        "warden_dashboard.html",
+        students=students,
+        attendance=attendance,
+        next_cursor=next_cursor,
+        hostels=hostels,
+        rooms=rooms,
+        photos=photos
+    )
+
+
+# ---------------- ADD HOSTEL ----------------
+ROOM_NUMBER_TEMPLATE = "R{n}"
+ROOM_NUMBER_FIELDS = {"n", "block", "floor", "room"}
+ROOM_NUMBER_SPEC = re.compile(r"0?[1-9]d?")   # at most a small zero pad, e.g. 02d
+MAX_HOSTEL_ROOMS = 2000
+MAX_HOSTEL_FLOORS = 100
+MAX_HOSTEL_BLOCKS = 26
+MAX_ROOM_CAPACITY = 20
+
+
+def check_room_template(template):
+    """Raise ValueError unless `template` only uses the bare room_layout
+    fields, each with at most a zero-pad spec (no attributes or indexes)."""
+    if len(template) > 64:
+        raise ValueError("template too long")
+    for _, field, spec, conversion in string.Formatter().parse(template):
+        if field is None:
+            continue
+        if (field not in ROOM_NUMBER_FIELDS or conversion
+                or (spec and not ROOM_NUMBER_SPEC.fullmatch(spec))):
+            raise ValueError(f"unsupported field {{{field}}}")
+
+
+def room_layout(total_rooms, floors=1, blocks=None, template=ROOM_NUMBER_TEMPLATE):
+    """Yield (block, floor, room_number) for a new hostel.
+
+    Rooms are spread evenly over blocks x floors. The numbering template
+    may use {n} (running number), {block}, {floor} and {room} (number
+    within the floor), e.g. "{block}{floor}{room:02d}" -> A101.
+    """
+    check_room_template(template)
+    blocks = blocks or [None]
+    per_floor = -(-total_rooms // (len(blocks) * floors))
+    n = 0
+    for block in blocks:
+        for floor in range(1, floors + 1):
+            for room in range(1, per_floor + 1):
+                if n == total_rooms:
+                    return
+                n += 1
+                yield block, floor, template.format(
+                    n=n, block=block or "", floor=floor, room=room)
+
+
+@app.route("/warden/add_hostel", methods=["POST"])
+def warden_add_hostel():
+    if session.get("role") != "warden":
+        return redirect("/")
+
+    name = request.form["hostel_name"]
+    total_rooms = request.form.get("total_rooms", 0, type=int)
+    floors = request.form.get("floors", 1, type=int) or 1
+    blocks = [b.strip() for b in request.form.get("blocks", "").split(",") if b.strip()]
+    template = request.form.get("numbering") or ROOM_NUMBER_TEMPLATE
+    capacity = request.form.get("capacity", 3, type=int)
+
+    if total_rooms < 1 or floors < 1:
+        flash("Rooms and floors must be at least 1")
+        return redirect("/warden")
+    if (total_rooms > MAX_HOSTEL_ROOMS or floors > MAX_HOSTEL_FLOORS
+            or len(blocks) > MAX_HOSTEL_BLOCKS):
+        flash(f"At most {MAX_HOSTEL_ROOMS} rooms, {MAX_HOSTEL_FLOORS} floors "
+              f"and {MAX_HOSTEL_BLOCKS} blocks per hostel")
+        return redirect("/warden")
+    if not 1 <= capacity <= MAX_ROOM_CAPACITY:
+        flash(f"Room capacity must be between 1 and {MAX_ROOM_CAPACITY}")
+        return redirect("/warden")
+
+    try:
+        layout = list(room_layout(total_rooms, floors, blocks, template))
+    except (KeyError, IndexError, ValueError):
+        flash("Invalid room numbering template")
+        return redirect("/warden")
+    if len({number for _, _, number in layout}) != len(layout):
+        flash("Room numbering template gives duplicate room numbers")
+        return redirect("/warden")
+
+    db = get_db()
+
+    cur = db.execute("""
+        INSERT INTO hostels (name, college, warden_id, total_rooms, available_rooms)
+        VALUES (?,?,?,?,?)
+    """, (
+        name,
+        session["college"],
+        session["uid"],
+        total_rooms,
+        total_rooms
+    ))
+
+    hostel_id = cur.lastrowid
+
+    # auto-create all rooms in one statement batch, same transaction
+    db.executemany("""
+        INSERT INTO rooms (hostel_id, room_number, block, floor, capacity)
+        VALUES (?,?,?,?,?)
+    """, ((hostel_id, number, block, floor, capacity) for block, floor, number in layout))
+
+    invalidate(db, session["college"])
+    db.commit()
+
+    flash("Hostel added successfully!")
+    return redirect("/warden")
+
+# ---------------- UPDATE ROOM DETAILS ----------------
+def room_capacity(value):
+    """A submitted room capacity: None (keep the current one) when blank or
+    not a number, ValueError when outside 1..MAX_ROOM_CAPACITY."""
+    try:
+        capacity = int(value)
+    except (TypeError, ValueError):
+        return None
+    if not 1 <= capacity <= MAX_ROOM_CAPACITY:
+        raise ValueError(f"Room capacity must be between 1 and {MAX_ROOM_CAPACITY}")
+    return capacity
+
+
+def update_rooms(db, updates):
+    """Apply (room_id, capacity, facilities, damage) updates in one batch.
+
+    None leaves a field unchanged; capacity never drops below the current
+    occupancy. Only rooms in the warden's own hostels are touched. Raises
+    ValueError, before anything is written, if a capacity is out of range.
+    Returns the number of rooms updated.
+    """
+    updates = [(room_id, room_capacity(capacity), facilities, damage)
+               for room_id, capacity, facilities, damage in updates]
+    cur = db.executemany("""
+        UPDATE rooms
+        SET capacity = MAX(COALESCE(?, capacity), occupied),
+            facilities = COALESCE(?, facilities),
+            damage = COALESCE(?, damage)
+        WHERE id = ?
+        AND hostel_id IN (SELECT id FROM hostels WHERE warden_id = ?)
+    """, ((capacity, facilities, damage, room_id, session["uid"])
+          for room_id, capacity, facilities, damage in updates))
+    if cur.rowcount:
+        invalidate(db, session["college"])
+    db.commit()
+    return cur.rowcount
+
+
+@app.route("/warden/update_room", methods=["POST"])
+def warden_update_room():
+    if session.get("role") != "warden":
+        return redirect("/")
+
+    room_id = request.form["room_id"]
+    capacity = request.form["capacity"]
+    facilities = request.form["facilities"]
+    damage = request.form["damage"]
+
+    try:
+        update_rooms(get_db(), [(room_id, capacity, facilities, damage)])
+    except ValueError as e:
+        flash(str(e))
+        return redirect("/warden")
+
+    flash("Room details updated!")
+    return redirect("/warden")
+
+@app.route("/warden/update_rooms", methods=["POST"])
+def warden_update_rooms():
+    """Update many rooms at once.
+
+    Form: room_ids (checked rooms) plus capacity/facilities/damage, where
+    blank fields are left unchanged. JSON: {"rooms": [{"room_id": 1,
+    "capacity": 4, "facilities": "AC, WiFi", "damage": "None"}]}.
+    """
+    if session.get("role") != "warden":
+        return redirect("/")
+
+    if request.is_json:
+        data = request.get_json(silent=True)
+        rooms = data.get("rooms", []) if isinstance(data, dict) else None
+        if not isinstance(rooms, list) or not all(isinstance(r, dict) for r in rooms):
+            return {"error": "Expected {\"rooms\": [{\"room_id\": ..., ...}, ...]}"}, 400
+        updates = [(r.get("room_id"), r.get("capacity"), r.get("facilities"), r.get("damage"))
+                   for r in rooms]
+    else:
+        fields = [request.form.get(f) or None for f in ("capacity", "facilities", "damage")]
+        updates = [(room_id, *fields) for room_id in request.form.getlist("room_ids")]
+
+    try:
+        updated = update_rooms(get_db(), updates)
+    except ValueError as e:
+        if request.is_json:
+            return {"error": str(e)}, 400
+        flash(str(e))
+        return redirect("/warden")
+
+    if request.is_json:
+        return {"updated": updated}
+    flash(f"{updated} room(s) updated!")
+    return redirect("/warden")
+
+# ---------------- TAKE ATTENDANCE ----------------
+def save_attendance(db, records):
+    """Upsert (student_id, date, status) records for the warden's college.
+
+    All rows go through one executemany in a single transaction; a student
+    marked twice on the same date keeps the latest status. Returns the
+    number of rows written and the rows rejected as invalid or as falling
+    in an archived year.
+    """
+    allowed = {r["id"] for r in db.execute("""
+        SELECT id FROM users
+        WHERE role='student' AND approved=1 AND college=?
+    """, (session["college"],))}
+
+    # archived years are read-only
+    until = archived_until(db) or ""
+
+    rows, rejected = [], []
+    for student_id, date, status in records:
+        status = str(status or "").strip().lower()
+        try:
+            student_id = int(student_id)
+            date = datetime.date.fromisoformat(date).isoformat()
+        except (TypeError, ValueError):
+            rejected.append((student_id, date, status))
+            continue
+        if (student_id not in allowed or status not in ATTENDANCE_STATUSES
+                or date < until):
+            rejected.append((student_id, date, status))
+            continue
+        rows.append((student_id, session["uid"], date, status))
+
+    db.executemany("""
+        INSERT INTO attendance (student_id, warden_id, date, status)
+        VALUES (?,?,?,?)
+        ON CONFLICT (student_id, date)
+        DO UPDATE SET status=excluded.status, warden_id=excluded.warden_id
+    """, rows)
+    db.commit()
+    return len(rows), rejected
+
+
+@app.route("/warden/attendance", methods=["POST"])
+def warden_attendance():
+    if session.get("role") != "warden":
+        return redirect("/")
+
+    student_id = request.form["student_id"]
+    date = request.form["date"]
+    status = request.form.get("status", "present")
+
+    saved, _ = save_attendance(get_db(), [(student_id, date, status)])
+
+    flash("Attendance marked!" if saved else "Invalid attendance entry")
+    return redirect("/warden")
+
+# ---------------- ROLL CALL ----------------
+@app.route("/warden/attendance/rollcall", methods=["POST"])
+def warden_rollcall():
+    """Mark a whole roll call for one date.
+
+    Accepts the dashboard form (date + status_<student_id> fields) or JSON:
+    {"date": "2025-01-31", "records": [{"student_id": 7, "status": "present"}]}
+    """
+    if session.get("role") != "warden":
+        return redirect("/")
+
+    if request.is_json:
+        data = request.get_json(silent=True)
+        records = data.get("records", []) if isinstance(data, dict) else None
+        if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+            return {"error": "Expected {\"date\": ..., \"records\": [{...}, ...]}"}, 400
+        date = data.get("date")
+        records = [(r.get("student_id"), r.get("date", date), r.get("status"))
+                   for r in records]
+    else:
+        date = request.form.get("date")
+        records = [(key[len("status_"):], date, value)
+                   for key, value in request.form.items()
+                   if key.startswith("status_")]
+
+    saved, rejected = save_attendance(get_db(), records)
+
+    if request.is_json:
+        return {"saved": saved, "rejected": len(rejected)}
+    flash(f"Roll call saved: {saved} marked, {len(rejected)} skipped")
+    return redirect("/warden")
+
+# ---------------- CSV IMPORT ----------------
+@app.route("/warden/attendance/import", methods=["POST"])
+def warden_attendance_import():
+    """Import an offline roll call.
+
+    CSV header: student_id or username, date, status. A date column may be
+    omitted when the form supplies one for the whole file.
+    """
+    if session.get("role") != "warden":
+        return redirect("/")
+
+    file = request.files.get("csv_file")
+    if not file:
+        flash("Please choose a CSV file")
+        return redirect("/warden")
+
+    db = get_db()
+    usernames = {r["username"]: r["id"] for r in db.execute("""
+        SELECT id, username FROM users
+        WHERE role='student' AND approved=1 AND college=?
+    """, (session["college"],))}
+
+    default_date = request.form.get("date")
+    reader = csv.DictReader(io.TextIOWrapper(file.stream, encoding="utf-8-sig"))
+    records = []
+    try:
+        for row in reader:
+            student_id = row.get("student_id") or usernames.get((row.get("username") or "").strip())
+            records.append((student_id, (row.get("date") or default_date or "").strip(), row.get("status")))
+    except (UnicodeDecodeError, csv.Error):
+        flash("Could not read the CSV file (it must be UTF-8 text)")
+        return redirect("/warden")
+
+    saved, rejected = save_attendance(db, records)
+
+    flash(f"CSV imported: {saved} marked, {len(rejected)} skipped")
+    return redirect("/warden")
+
+# ---------------- GUARDIAN DASHBOARD ----------------
+@app.route("/guardian")
+def guardian():
+    if session.get("role") != "guardian":
+        return redirect("/")
+
+    db = get_db()
+    
+    # Attendance of students in the same college (first page)
+    attendance, next_cursor = attendance_page(db, request.args)
+
+    # Per-student percentages from the summary table
+    summary = college_attendance_summary(db, session["college"])
+
+    return render_template("guardian_dashboard.html",
+                           attendance=attendance,
+                           next_cursor=next_cursor,
+                           summary=summary,
+                           threshold=DEFAULTER_THRESHOLD)
+
+
+# ---------------- ATTENDANCE FEED ----------------
+ATTENDANCE_PAGE_SIZE = 50
+ATTENDANCE_STATUSES = ("present", "absent")
+
+
+def attendance_page(db, args):
+    """One keyset page of the caller's attendance feed, newest first.
+
+    Pages are anchored on a (date, id) cursor instead of OFFSET, so every
+    page is an index range walk no matter how much history exists.
+    Supported args: cursor, from, to, status, limit.
+    """
+    before_date, before_id = "9999-12-31", sys.maxsize
+    cursor = args.get("cursor", "")
+    if "|" in cursor:
+        date, _, last_id = cursor.rpartition("|")
+        if last_id.isdigit():
+            before_date, before_id = date, int(last_id)
+
+    date_from = args.get("from") or "0000-01-01"
+    date_to = args.get("to") or "9999-12-31"
+    status = args.get("status", "").lower()
+    statuses = (status, status) if status in ATTENDANCE_STATUSES else ATTENDANCE_STATUSES
+
+    limit = max(1, min(args.get("limit", ATTENDANCE_PAGE_SIZE, type=int) or ATTENDANCE_PAGE_SIZE,
+                       ATTENDANCE_PAGE_SIZE * 4))
+    # The cursor tightens the upper bound of the index range; rows sharing
+    # the cursor's date are then filtered by id
+    params = (date_from, min(date_to, before_date), before_date, before_id,
+              *statuses, limit + 1)
+
+    attach_archives(db)
+    role = session.get("role")
+    if role == "student":
+        rows = db.execute("""
+            SELECT a.id, a.date, a.status
+            FROM attendance_all a
+            WHERE a.student_id = ?
+            AND a.date BETWEEN ? AND ?
+            AND (a.date < ? OR a.id < ?)
+            AND a.status IN (?, ?)
+            ORDER BY a.date DESC, a.id DESC
+            LIMIT ?
+        """, (session["uid"], *params)).fetchall()
+    elif role == "warden":
+        rows = db.execute("""
+            SELECT a.id, u.username, a.date, a.status
+            FROM attendance_all a
+            JOIN users u ON a.student_id = u.id
+            WHERE a.warden_id = ?
+            AND a.date BETWEEN ? AND ?
+            AND (a.date < ? OR a.id < ?)
+            AND a.status IN (?, ?)
+            ORDER BY a.date DESC, a.id DESC
+            LIMIT ?
+        """, (session["uid"], *params)).fetchall()
+    elif role == "guardian":
+        # CROSS JOIN pins attendance as the outer loop so the date index
+        # delivers rows already sorted and LIMIT can stop early
+        rows = db.execute("""
+            SELECT a.id, u.username, a.date, a.status
+            FROM attendance_all a
+            CROSS JOIN users u ON a.student_id = u.id
+            WHERE u.college = ?
+            AND a.date BETWEEN ? AND ?
+            AND (a.date < ? OR a.id < ?)
+            AND a.status IN (?, ?)
+            ORDER BY a.date DESC, a.id DESC
+            LIMIT ?
+        """, (session["college"], *params)).fetchall()
+    else:
+        return [], None
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['date']}|{rows[-1]['id']}"
+    return rows, next_cursor
+
+
+@app.route("/attendance/feed")
+def attendance_feed():
+    if session.get("role") not in ("student", "warden", "guardian"):
+        return {"error": "Please login first!"}, 401
+
+    rows, next_cursor = attendance_page(get_db(), request.args)
+    return {"items": [dict(r) for r in rows], "next": next_cursor}
+
+# ---------------- ATTENDANCE SUMMARY ----------------
+# Read from attendance_monthly / attendance_daily_college (migration 4),
+# so these cost O(students) or O(days), never O(attendance rows).
+DEFAULTER_THRESHOLD = 75.0  # percent present
+
+
+def student_attendance_summary(db, student_id):
+    return db.execute("""
+        SELECT month, present, absent,
+               ROUND(100.0 * present / MAX(present + absent, 1), 1) AS percentage
+        FROM attendance_monthly
+        WHERE student_id = ?
+        ORDER BY month DESC
+    """, (student_id,)).fetchall()
+
+
+def college_attendance_summary(db, college, month_from=None, month_to=None):
+    """Per-student totals for a college, lowest attendance first."""
+    return db.execute("""
+        SELECT u.id AS student_id, u.username,
+               SUM(m.present) AS present, SUM(m.absent) AS absent,
+               ROUND(100.0 * SUM(m.present) / MAX(SUM(m.present + m.absent), 1), 1)
+                   AS percentage
+        FROM users u
+        JOIN attendance_monthly m ON m.student_id = u.id
+        WHERE u.role = 'student' AND u.approved = 1 AND u.college = ?
+        AND m.month BETWEEN ? AND ?
+        GROUP BY u.id
+        HAVING SUM(m.present + m.absent) > 0
+        ORDER BY percentage, u.username
+    """, (college, month_from or "0000-01", month_to or "9999-12")).fetchall()
+
+
+def college_daily_rates(db, college, days=30):
+    return db.execute("""
+        SELECT date, present, absent,
+               ROUND(100.0 * present / MAX(present + absent, 1), 1) AS rate
+        FROM attendance_daily_college
+        WHERE college = ?
+        ORDER BY date DESC
+        LIMIT ?
+    """, (college, days)).fetchall()
+
+
+@app.route("/attendance/summary")
+def attendance_summary():
+    """JSON attendance percentages scoped to the caller.
+
+    Students get their own monthly totals; wardens, guardians and
+    principals get per-student totals, defaulters and daily rates for
+    their college. Optional args: from/to (YYYY-MM), threshold, days.
+    """
+    role = session.get("role")
+    if role not in ("student", "warden", "guardian", "principal"):
+        return {"error": "Please login first!"}, 401
+
+    db = get_db()
+    if role == "student":
+        return {"months": [dict(r) for r in student_attendance_summary(db, session["uid"])]}
+
+    threshold = request.args.get("threshold", DEFAULTER_THRESHOLD, type=float)
+    students = college_attendance_summary(db, session["college"],
+                                          request.args.get("from"),
+                                          request.args.get("to"))
+    daily = college_daily_rates(db, session["college"],
+                                request.args.get("days", 30, type=int))
+    return {
+        "students": [dict(r) for r in students],
+        "defaulters": [dict(r) for r in students if r["percentage"] < threshold],
+        "daily": [dict(r) for r in daily],
+    }
+
+
+# ---------------- ATTENDANCE ARCHIVE ----------------
+# Closed academic years are moved out of attendance into one file per year
+# under ARCHIVE_DIR by `flask archive-attendance`. Reads that may reach
+# back into history go through attendance_all instead of attendance.
+app.config["ARCHIVE_DIR"] = os.getenv("ARCHIVE_DIR", "archive")
+app.config["ACADEMIC_YEAR_START"] = os.getenv("ACADEMIC_YEAR_START", "06-01")  # MM-DD
+
+
+def academic_year(date):
+    """Start year of the academic year a YYYY-MM-DD date falls in."""
+    year = int(date[:4])
+    return year if date[5:] >= app.config["ACADEMIC_YEAR_START"] else year - 1
+
+
+def academic_year_range(year):
+    """[start, end) dates of an academic year."""
+    start = app.config["ACADEMIC_YEAR_START"]
+    return f"{year}-{start}", f"{year + 1}-{start}"
+
+
+def archived_until(db):
+    """First date still kept in the hot table, or None if nothing is archived."""
+    return db.execute("SELECT MAX(date_to) FROM attendance_archives").fetchone()[0]
+
+
+def attach_archives(db):
+    """Attach every archive read-only and point attendance_all at them.
 
-    return render_template(
-        "warden_dashboard.html",
-        students=students,
-        attendance=attendance,
-        hostels=hostels,
-        rooms=rooms,
-        photos=photos
-    )
+    attendance_all (migration 12) is a plain view of attendance; once years
+    are archived, each connection shadows it with a TEMP view that UNION ALLs
+    the hot table and the archives. SQLite merges the branches in index
+    order, so keyset pages and streamed exports need no sort. Cheap enough
+    to call per request: a pooled connection remembers the archive list it
+    was set up for (a file that failed to attach included, so it is not
+    retried until the connection is recycled) and only changes trigger work.
+    ATTACH cannot run inside a transaction, so a change then raises rather
+    than silently reading without the archived years.
+    """
+    wanted = {f"archive_{year}": filename for year, filename in db.execute(
+        "SELECT year, filename FROM attendance_archives ORDER BY year")}
+    if getattr(db, "archives", None) == wanted:
+        return
+    attached = {r[1] for r in db.execute("PRAGMA database_list") if r[1].startswith("archive_")}
+    if wanted or attached:
+        if db.in_transaction:
+            raise RuntimeError("attach_archives() called inside a transaction; "
+                               "attendance_all would miss the archived years")
 
+        for name in attached - wanted.keys():
+            db.execute(f"DETACH {name}")
+        schemas = ["main"]
+        for name, filename in wanted.items():
+            if name not in attached:
+                path = os.path.join(app.config["ARCHIVE_DIR"], filename)
+                try:
+                    db.execute(f"ATTACH ? AS {name}", (f"file:{urllib.parse.quote(path)}?mode=ro",))
+                except sqlite3.OperationalError as e:
+                    print(f"Attendance archive {path} not attached: {e}")
+                    continue
+            schemas.append(name)
 
-# ---------------- ADD HOSTEL ----------------
-@app.route("/warden/add_hostel", methods=["POST"])
-def warden_add_hostel():
-    if session.get("role") != "warden":
-        return redirect("/")
+        db.execute("DROP VIEW IF EXISTS temp.attendance_all")
+        db.execute("CREATE TEMP VIEW attendance_all AS " + " UNION ALL ".join(
+            f"SELECT id, student_id, warden_id, date, status FROM {schema}.attendance"
+            for schema in schemas))
+    if isinstance(db, PooledConnection):
+        db.archives = wanted
 
-    name = request.form["hostel_name"]
-    total_rooms = int(request.form["total_rooms"])
 
-    db = get_db()
+# ---------------- EXPORTS ----------------
+# Reports stream straight off a SQLite cursor, EXPORT_BATCH rows per chunk,
+# so a year of a college's attendance is never held in memory and the
+# download starts with the first batch. Each query walks its indexes in
+# output order: an ORDER BY that needs a sort would read everything first.
+EXPORT_BATCH = 1000
+EXPORT_REPORTS = {  # report -> roles that may export it
+    "attendance": ("principal", "warden", "guardian"),
+    "occupancy": ("principal", "warden"),
+    "applications": ("principal", "warden"),
+}
+# a CSV field that spreadsheet_safe() would change
+FORMULA_START = re.compile(r'(?:^|,)"?[=+\-@\t\r]', re.M)
+XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Report" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'),
+}
 
-    cur = db.execute("""
-        INSERT INTO hostels (name, college, warden_id, total_rooms, available_rooms)
-        VALUES (?,?,?,?,?)
-    """, (
-        name,
-        session["college"],
-        session["uid"],
-        total_rooms,
-        total_rooms
-    ))
 
-    hostel_id = cur.lastrowid
+def export_rows(db, report, args):
+    """Cursor over a report for the caller: wardens get their own hostels,
+    principals and guardians their college. Attendance takes from/to
+    (YYYY-MM-DD), applications a status."""
+    dates = (args.get("from") or "0000-01-01", args.get("to") or "9999-12-31")
+    status = args.get("status") or None
+    if report == "attendance":
+        attach_archives(db)
+    if session["role"] == "warden":
+        if report == "attendance":
+            return db.execute("""
+                SELECT a.date, u.id AS student_id, u.username AS student,
+                       h.name AS hostel, r.room_number AS room, a.status
+                FROM attendance_all a
+                JOIN users u ON u.id = a.student_id
+                LEFT JOIN rooms r ON r.id = u.room_id
+                LEFT JOIN hostels h ON h.id = r.hostel_id
+                WHERE a.warden_id = ? AND a.date BETWEEN ? AND ?
+                ORDER BY a.date, a.id
+            """, (session["uid"], *dates))
+        if report == "occupancy":
+            return db.execute("""
+                SELECT h.name AS hostel, r.block, r.floor, r.room_number AS room,
+                       r.capacity, r.occupied, r.capacity - r.occupied AS free,
+                       r.facilities, r.damage
+                FROM hostels h
+                JOIN rooms r ON r.hostel_id = h.id
+                WHERE h.warden_id = ?
+                ORDER BY h.id, r.id
+            """, (session["uid"],))
+        return db.execute("""
+            SELECT a.id AS application_id, u.id AS student_id, u.username AS student,
+                   h.name AS hostel, r.room_number AS room, a.status
+            FROM hostels h
+            JOIN applications a ON a.hostel_id = h.id
+            JOIN users u ON u.id = a.student_id
+            LEFT JOIN rooms r ON r.id = a.room_id
+            WHERE h.warden_id = ? AND (? IS NULL OR a.status = ?)
+            ORDER BY h.id, a.id
+        """, (session["uid"], status, status))
 
-    # auto-create room numbers
-    for i in range(1, total_rooms + 1):
-        db.execute("""
-            INSERT INTO rooms (hostel_id, room_number)
-            VALUES (?,?)
-        """, (hostel_id, f"R{i}"))
+    if report == "attendance":
+        # student by student: users(college) then each one's (student_id, date)
+        # index, so rows come out in order without a sort
+        return db.execute("""
+            SELECT a.date, u.id AS student_id, u.username AS student,
+                   h.name AS hostel, r.room_number AS room, a.status
+            FROM users u
+            CROSS JOIN attendance_all a ON a.student_id = u.id
+            LEFT JOIN rooms r ON r.id = u.room_id
+            LEFT JOIN hostels h ON h.id = r.hostel_id
+            WHERE u.college = ? AND a.date BETWEEN ? AND ?
+            ORDER BY u.id, a.date
+        """, (session["college"], *dates))
+    if report == "occupancy":
+        return db.execute("""
+            SELECT h.name AS hostel, r.block, r.floor, r.room_number AS room,
+                   r.capacity, r.occupied, r.capacity - r.occupied AS free,
+                   r.facilities, r.damage
+            FROM hostels h
+            JOIN rooms r ON r.hostel_id = h.id
+            WHERE h.college = ?
+            ORDER BY h.id, r.id
+        """, (session["college"],))
+    return db.execute("""
+        SELECT a.id AS application_id, u.id AS student_id, u.username AS student,
+               h.name AS hostel, r.room_number AS room, a.status
+        FROM hostels h
+        JOIN applications a ON a.hostel_id = h.id
+        JOIN users u ON u.id = a.student_id
+        LEFT JOIN rooms r ON r.id = a.room_id
+        WHERE h.college = ? AND (? IS NULL OR a.status = ?)
+        ORDER BY h.id, a.id
+    """, (session["college"], status, status))
 
-    db.commit()
-    db.close()
 
-    flash("Hostel added successfully!")
-    return redirect("/warden")
+def spreadsheet_safe(value):
+    """Keep text such as "=HYPERLINK(...)" from running as a formula."""
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@", "\t", "\r"):
+        return "'" + value
+    return value
 
-# ---------------- UPDATE ROOM DETAILS ----------------
-@app.route("/warden/update_room", methods=["POST"])
-def warden_update_room():
-    if session.get("role") != "warden":
-        return redirect("/")
 
-    room_id = request.form["room_id"]
-    capacity = request.form["capacity"]
-    facilities = request.form["facilities"]
-    damage = request.form["damage"]
+def csv_chunks(cursor):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write("\ufeff")   # BOM, so Excel reads the file as UTF-8
+    writer.writerow([c[0] for c in cursor.description])
+    while True:
+        rows = cursor.fetchmany(EXPORT_BATCH)
+        start = buf.tell()
+        writer.writerows(rows)
+        if FORMULA_START.search(buf.getvalue(), start):
+            # rare, so only then is the batch redone cell by cell
+            buf.seek(start)
+            buf.truncate()
+            writer.writerows([spreadsheet_safe(v) for v in row] for row in rows)
+        yield buf.getvalue()
+        if not rows:
+            return
+        buf.seek(0)
+        buf.truncate()
 
-    db = get_db()
-    db.execute("""
-        UPDATE rooms SET capacity=?, facilities=?, damage=? WHERE id=?
-    """, (capacity, facilities, damage, room_id))
-    db.commit()
-    db.close()
 
-    flash("Room details updated!")
-    return redirect("/warden")
+class ChunkWriter:
+    """Unseekable file object that hands written bytes back via drain()."""
 
-# ---------------- TAKE ATTENDANCE ----------------
-@app.route("/warden/attendance", methods=["POST"])
-def warden_attendance():
-    if session.get("role") != "warden":
-        return redirect("/")
+    def __init__(self):
+        self.chunks = []
 
-    student_id = request.form["student_id"]
-    date = request.form["date"]
-    status = request.form["status"].lower()
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
 
-    db = get_db()
-    db.execute("""
-        INSERT INTO attendance (student_id, warden_id, date, status)
-        VALUES (?,?,?,?)
-    """, (student_id, session["uid"], date, status))
+    def flush(self):
+        pass
 
-    db.commit()
-    db.close()
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
 
-    flash("Attendance marked!")
-    return redirect("/warden")
 
-# ---------------- GUARDIAN DASHBOARD ----------------
-@app.route("/guardian")
-def guardian():
-    if session.get("role") != "guardian":
+def xlsx_row(values):
+    cells = []
+    for value in values:
+        if value is None:
+            cells.append("<c/>")
+        elif isinstance(value, (int, float)):
+            cells.append(f"<c><v>{value}</v></c>")
+        else:
+            text = xml_escape(XML_INVALID.sub("", str(value)))
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return "<row>" + "".join(cells) + "</row>"
+
+
+def xlsx_chunks(cursor):
+    """A one-sheet workbook, zipped as it is written (inline strings, so
+    there is no shared-string table to build up front)."""
+    out = ChunkWriter()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, xml in XLSX_PARTS.items():
+            zf.writestr(name, xml)
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/'
+                        b'spreadsheetml/2006/main"><sheetData>')
+            sheet.write(xlsx_row(c[0] for c in cursor.description).encode())
+            for rows in iter(lambda: cursor.fetchmany(EXPORT_BATCH), []):
+                sheet.write("".join(xlsx_row(r) for r in rows).encode())
+                yield out.drain()
+            sheet.write(b"</sheetData></worksheet>")
+    yield out.drain()
+
+
+@app.route("/export/<report>")
+def export(report):
+    """Download a report as ?format=csv (default) or xlsx."""
+    if report not in EXPORT_REPORTS:
+        abort(404)
+    if session.get("role") not in EXPORT_REPORTS[report]:
         return redirect("/")
 
-    db = get_db()
-    
-    # Fetch attendance of students in the same college
-    attendance = db.execute("""
-        SELECT u.username, a.date, a.status 
-        FROM attendance a
-        JOIN users u ON a.student_id = u.id
-        WHERE u.college = ?
-        ORDER BY a.date DESC
-    """, (session["college"],)).fetchall()
-    
-    db.close()
-    return render_template("guardian_dashboard.html", attendance=attendance)
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "xlsx"):
+        abort(400)
+    cursor = export_rows(get_db(), report, request.args)
+    filename = secure_filename(f"{report}-{session['college']}-{datetime.date.today()}.{fmt}")
+    chunks = csv_chunks(cursor) if fmt == "csv" else xlsx_chunks(cursor)
+    mimetype = ("text/csv" if fmt == "csv" else
+                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    # stream_with_context keeps the request (and its pooled connection)
+    # alive until the last chunk is sent
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Cache-Control": "no-store",
+        "X-Accel-Buffering": "no",
+    })
 
 
 # ---------------- Forgot password ----------------
 # ---------------- Forgot password ----------------
-import random
 
 @app.route("/forgot_password", methods=["GET", "POST"])
 def forgot_password():
@@ -540,23 +3244,20 @@ def forgot_password():
                 error="Please enter email or mobile number"
             )
 
-        db = get_db()
-        user = db.execute("""
+        _, user = account(main_db().execute("""
             SELECT * FROM users
             WHERE email = ? OR phone = ?
-        """, (contact, contact)).fetchone()
+        """, (contact, contact)).fetchone())
 
         print("USER FOUND:", user)  # ✅ DEBUG
 
         if not user:
-            db.close()
             return render_template(
                 "forgot_password.html",
                 error="No account found with this email or mobile number"
             )
 
         if not user["email"]:
-            db.close()
             return render_template(
                 "forgot_password.html",
                 error="No email address is linked to this account. Cannot send OTP."
@@ -572,13 +3273,11 @@ def forgot_password():
             send_otp_email(user["email"], otp)
         except Exception as e:
             print(f"Email Error: {e}")
-            db.close()
             return render_template(
                 "forgot_password.html",
                 error="Mail server issue: Failed to send OTP email."
             )
 
-        db.close()
         return render_template("verify_otp.html")
 
     return render_template("forgot_password.html")
@@ -612,15 +3311,16 @@ def verify_otp():
 @app.route("/reset_password", methods=["GET","POST"])
 def reset_password():
     if request.method == "POST":
-        hashed = generate_password_hash(request.form["password"])
+        hashed = hash_password(request.form["password"])
 
-        db = get_db()
+        db, _ = account(main_db().execute(
+            "SELECT * FROM users WHERE id=?", (session["reset_uid"],)).fetchone())
         db.execute(
             "UPDATE users SET password=? WHERE id=?",
             (hashed, session["reset_uid"])
         )
         db.commit()
-        db.close()
+        end_sessions(session["reset_uid"])
 
         session.clear()
         flash("Password updated successfully")
@@ -633,7 +3333,7 @@ def warden_photo():
     if session.get("role") != "warden":
         return redirect("/")
 
-    file = request.files["photo"]
+    file = request.files.get("photo")
     hostel_id = request.form.get("hostel_id")
     room_id = request.form.get("room_id")
 
@@ -641,9 +3341,6 @@ def warden_photo():
         flash("Please select a hostel, room, and file")
         return redirect("/warden")
 
-    filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
-    file.save(os.path.join(UPLOAD_FOLDER, filename))
-
     db = get_db()
     # Ensure the hostel and room belong to this warden and college
     valid = db.execute("""
@@ -653,57 +3350,1187 @@ def warden_photo():
     """, (room_id, hostel_id, session["uid"], session["college"])).fetchone()
 
     if valid:
+        filename = save_upload(file)
         db.execute("""
             INSERT INTO room_photos (hostel_id, room_id, warden_id, filename)
             VALUES (?,?,?,?)
         """, (hostel_id, room_id, session["uid"], filename))
+        invalidate(db, session["college"])
         db.commit()
         flash("Photo uploaded successfully")
     else:
         flash("Invalid room or hostel selection")
 
-    db.close()
     return redirect("/warden")
 # for otp mail
+app.config["MAIL_SERVER"] = os.getenv("MAIL_SERVER", "smtp.gmail.com")
+app.config["MAIL_PORT"] = int(os.getenv("MAIL_PORT", "465"))
+app.config["MAIL_USE_SSL"] = os.getenv("MAIL_USE_SSL", "1") == "1"
+app.config["MAIL_USERNAME"] = os.getenv("MAIL_USERNAME", "")
+app.config["MAIL_PASSWORD"] = os.getenv("MAIL_PASSWORD", "")
+app.config["MAIL_SENDER"] = os.getenv("MAIL_SENDER", app.config["MAIL_USERNAME"])
+app.config["MAIL_WORKERS"] = 2          # sender threads per process
+app.config["MAIL_MAX_ATTEMPTS"] = 5
+app.config["MAIL_RETRY_DELAY"] = 5      # seconds, doubled on every retry
+app.config["MAIL_KEEPALIVE"] = 60       # close an idle SMTP session after this
+app.config["MAIL_LEASE"] = 120          # a claimed message is retried after this
+
+
 def send_otp_email(to_email, otp):
-    EMAIL_ADDRESS = "indrakumar3995@gmail.com"
-    EMAIL_PASSWORD = "vrcyysgxcnlyoztu"
-
-    msg = EmailMessage()
-    msg["Subject"] = "Hostel System - OTP Verification"
-    msg["From"] = EMAIL_ADDRESS
-    msg["To"] = to_email
-    msg.set_content(f"""
+    """Queue the OTP mail; a background sender delivers it."""
+    queue_mail(main_db(), to_email, "Hostel System - OTP Verification", f"""
 Your OTP is: {otp}
 
 This OTP is valid for 5 minutes.
 Do not share it with anyone.
 """)
 
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-        server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-        server.send_message(msg)
+
+def queue_mail(db, to_email, subject, body):
+    db.execute("""
+        INSERT INTO mail_outbox (to_addr, subject, body, next_attempt_at, created_at)
+        VALUES (?,?,?,?,?)
+    """, (to_email, subject, body, time.time(), time.time()))
+    db.commit()
+    mailer.start()
+    mailer.wake.set()
+
+
+class SMTPSession:
+    """One SMTP connection reused across messages, reopened when dropped."""
+
+    def __init__(self):
+        self.server = None
+        self.last_used = 0.0
+
+    def _open(self):
+        if app.config["MAIL_USE_SSL"]:
+            server = smtplib.SMTP_SSL(app.config["MAIL_SERVER"], app.config["MAIL_PORT"], timeout=30)
+        else:
+            server = smtplib.SMTP(app.config["MAIL_SERVER"], app.config["MAIL_PORT"], timeout=30)
+        if app.config["MAIL_USERNAME"] and app.config["MAIL_PASSWORD"]:
+            server.login(app.config["MAIL_USERNAME"], app.config["MAIL_PASSWORD"])
+        self.server = server
+
+    def send(self, msg):
+        if self.server is not None:
+            try:
+                self.server.noop()
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self.server is None:
+            self._open()
+        self.server.send_message(msg)
+        self.last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self.server is not None and time.monotonic() - self.last_used > app.config["MAIL_KEEPALIVE"]:
+            self.close()
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.server = None
+
+
+class Mailer:
+    """Background threads that drain mail_outbox over kept-alive SMTP sessions."""
+
+    def __init__(self):
+        self.wake = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self.stats = {"sent": 0, "failed": 0, "retried": 0,
+                      "send_time_total": 0.0, "send_time_max": 0.0,
+                      "delivery_time_total": 0.0, "delivery_time_max": 0.0}
+
+    def start(self):
+        """Start the sender threads once per process (after any fork).
+
+        Without MAIL_SENDER nothing is started and mail stays queued in the
+        outbox until the settings are filled in.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            if not mail_configured():
+                return
+            for i in range(app.config["MAIL_WORKERS"]):
+                threading.Thread(target=self._run, name=f"mailer-{i}", daemon=True).start()
+
+    def _run(self):
+        smtp = SMTPSession()
+        while True:
+            try:
+                if not self.deliver(smtp, limit=10):
+                    smtp.close_if_idle()
+                    self.wake.wait(timeout=5)
+                    self.wake.clear()
+            except Exception as e:
+                print(f"Mailer Error: {e}")
+                time.sleep(1)
+
+    def claim(self, db, limit):
+        """Lease up to `limit` due messages to this sender."""
+        def work(db):
+            now = time.time()
+            rows = db.execute("""
+                SELECT id, to_addr, subject, body, attempts, created_at
+                FROM mail_outbox
+                WHERE status IN ('pending','sending') AND next_attempt_at <= ?
+                ORDER BY next_attempt_at
+                LIMIT ?
+            """, (now, limit)).fetchall()
+            db.executemany("""
+                UPDATE mail_outbox
+                SET status='sending', next_attempt_at=?
+                WHERE id=?
+            """, ((now + app.config["MAIL_LEASE"], r["id"]) for r in rows))
+            return rows
+        return immediate_transaction(db, work)
+
+    def deliver(self, smtp, limit=10):
+        """Send one batch of due messages; return how many were attempted."""
+        pool = get_pool()
+        db = pool.acquire()
+        try:
+            rows = self.claim(db, limit)
+            for row in rows:
+                msg = EmailMessage()
+                msg["Subject"] = row["subject"]
+                msg["From"] = app.config["MAIL_SENDER"]
+                msg["To"] = row["to_addr"]
+                msg.set_content(row["body"])
+
+                started = time.monotonic()
+                try:
+                    smtp.send(msg)
+                except Exception as e:
+                    smtp.close()
+                    self._failed(db, row, e)
+                    continue
+
+                elapsed = time.monotonic() - started
+                # The body (an OTP) is not kept once delivered
+                db.execute("""
+                    UPDATE mail_outbox
+                    SET status='sent', body='', sent_at=?, attempts=attempts + 1
+                    WHERE id=?
+                """, (time.time(), row["id"]))
+                db.commit()
+                with self._lock:
+                    delivery = time.time() - row["created_at"]
+                    self.stats["sent"] += 1
+                    self.stats["send_time_total"] += elapsed
+                    self.stats["send_time_max"] = max(self.stats["send_time_max"], elapsed)
+                    self.stats["delivery_time_total"] += delivery
+                    self.stats["delivery_time_max"] = max(self.stats["delivery_time_max"], delivery)
+            return len(rows)
+        finally:
+            pool.release(db)
+
+    def _failed(self, db, row, error):
+        attempts = row["attempts"] + 1
+        if attempts >= app.config["MAIL_MAX_ATTEMPTS"]:
+            status, key = "failed", "failed"
+        else:
+            status, key = "pending", "retried"
+        db.execute("""
+            UPDATE mail_outbox
+            SET status=?, attempts=?, next_attempt_at=?, last_error=?
+            WHERE id=?
+        """, (status, attempts,
+              time.time() + app.config["MAIL_RETRY_DELAY"] * 2 ** (attempts - 1),
+              str(error)[:500], row["id"]))
+        db.commit()
+        with self._lock:
+            self.stats[key] += 1
+        print(f"Email Error: {error}")
+
+    def snapshot(self, db):
+        depth = {r["status"]: r["n"] for r in db.execute("""
+            SELECT status, COUNT(*) AS n FROM mail_outbox
+            WHERE status IN ('pending','sending','failed')
+            GROUP BY status
+        """)}
+        with self._lock:
+            stats = dict(self.stats)
+        sent = stats["sent"]
+        stats["send_time_avg"] = stats["send_time_total"] / sent if sent else 0.0
+        stats["delivery_time_avg"] = stats["delivery_time_total"] / sent if sent else 0.0
+        stats["queue"] = {s: depth.get(s, 0) for s in ("pending", "sending", "failed")}
+        return stats
+
+
+mailer = Mailer()
+
+
+@app.route("/debug_mail")
+def debug_mail():
+    if session.get("role") != "admin":
+        return redirect("/")
+    return mailer.snapshot(get_db())
+
 # ---------------- RUN ----------------
 # ---------------- AI BOT ROUTE ----------------
-@app.route("/chat", methods=["POST"])
-def chat():
+app.config["CHAT_MAX_CONCURRENCY"] = 4   # model calls in flight per worker
+app.config["CHAT_QUEUE_TIMEOUT"] = 2     # seconds to wait for a free slot
+app.config["CHAT_TIMEOUT"] = 30          # seconds a model call may take, streams included
+app.config["CHAT_RATE_LIMIT"] = 10       # messages per user ...
+app.config["CHAT_RATE_WINDOW"] = 60      # ... per this many seconds
+app.config["CHAT_CACHE_TTL"] = 3600
+app.config["CHAT_MAX_CHARS"] = 2000      # longest question accepted
+
+chat_slots = threading.BoundedSemaphore(app.config["CHAT_MAX_CONCURRENCY"])
+chat_cache = FragmentCache(1024, app.config["CHAT_CACHE_TTL"])
+chat_history = collections.defaultdict(collections.deque)
+chat_history_lock = threading.Lock()
+chat_model_lock = threading.Lock()
+CHAT_BUSY = "Lots of students are chatting right now. Try again in a moment!"
+CHAT_ERROR = "I'm having trouble thinking right now. Try again later!"
+
+
+def get_chat_model():
+    """The model /chat talks to; tests can put a fake in app.extensions.
+
+    The Gemini SDK takes most of a second to import, so it is loaded and
+    configured on the first chat instead of at worker start.
+    """
+    model = app.extensions.get("chat_model")
+    if model is None:
+        with chat_model_lock:
+            model = app.extensions.get("chat_model")
+            if model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=app.config["GEMINI_API_KEY"])
+                model = app.extensions["chat_model"] = genai.GenerativeModel(app.config["CHAT_MODEL"])
+    return model
+
+
+def build_chat_prompt(user_message):
+    college = session.get("college") or "the college"
+    context = chat_context(get_db(), user_message)
+    # System Instruction: Tells the AI its job. Only personal questions name
+    # the user: other answers are shared per college and role (chat_cache_key)
+    user = f"a {session.get('role')}"
+    if is_personal(user_message):
+        user = f"{session.get('username')} ({session.get('role')})"
+    prompt = f"You are a helpful Hostel Assistant for {college}. The user is {user}."
+    if context:
+        prompt += ("\nUse these facts from the hostel system when they are relevant:\n"
+                   + "\n".join(f"- {line}" for line in context))
+    return prompt + f"\nAnswer: {user_message}"
+
+
+def normalize_message(message):
+    """Cache key for a question: case, punctuation and spacing ignored."""
+    return " ".join(re.sub(r"[^\w\s]", " ", message.lower()).split())
+
+
+def chat_cache_key(user_message):
+    """Answers are shared per college and role until the college's data
+    changes; personal questions are only ever answered from the asker's
+    own cache."""
+    db = get_db()
+    college = session.get("college")
+    owner = session.get("uid") if is_personal(user_message) else None
+    return (college, cache_version(db, college), session.get("role"), owner,
+            normalize_message(user_message))
+
+
+def chat_rate_limited(username):
+    """Sliding-window limit of CHAT_RATE_LIMIT messages per user."""
+    now = time.monotonic()
+    with chat_history_lock:
+        history = chat_history[username]
+        while history and now - history[0] > app.config["CHAT_RATE_WINDOW"]:
+            history.popleft()
+        if len(history) >= app.config["CHAT_RATE_LIMIT"]:
+            return True
+        history.append(now)
+        return False
+
+
+def chat_request():
+    """Validate a chat call; return (message, None) or (None, error response)."""
     # Only allow logged-in users to chat
     if "username" not in session:
-        return {"response": "Please login first!"}, 401
+        return None, ({"response": "Please login first!"}, 401)
 
-    data = request.json
-    user_message = data.get("message")
-    
-    # System Instruction: Tells the AI its job
-    prompt = f"You are a helpful Hostel Assistant for MNR College. The user is {session.get('username')}. Answer: {user_message}"
-    
+    data = request.get_json(silent=True)
+    message = data.get("message") if isinstance(data, dict) else None
+    user_message = message.strip() if isinstance(message, str) else ""
+    if not user_message:
+        return None, ({"response": "Please type a question."}, 400)
+    # before the cache key, prompt and rate limiter ever see it
+    if len(user_message) > app.config["CHAT_MAX_CHARS"]:
+        return None, ({"response": f"Please keep questions under "
+                                   f"{app.config['CHAT_MAX_CHARS']} characters."}, 400)
+    if chat_rate_limited(session["username"]):
+        return None, ({"response": "You're sending messages too fast. Slow down a little!"}, 429)
+    return user_message, None
+
+
+def chat_slot_releaser():
+    """Give back the chat slot taken for one call exactly once, whichever
+    of its cleanup paths gets there first."""
+    held = [True]
+
+    def release():
+        try:
+            held.pop()
+        except IndexError:
+            return
+        chat_slots.release()
+    return release
+
+
+@app.route("/chat", methods=["POST"])
+def chat():
+    user_message, error = chat_request()
+    if error:
+        return error
+
+    key = chat_cache_key(user_message)
+    hit = chat_cache.get(key)
+    if hit is not None:
+        return {"response": hit, "cached": True}
+
+    # The prompt reads the database, so it is built before taking a slot
+    prompt = build_chat_prompt(user_message)
+    if not chat_slots.acquire(timeout=app.config["CHAT_QUEUE_TIMEOUT"]):
+        return {"response": CHAT_BUSY}, 503
+    try:
+        # Gemini 3 Flash is optimized for these agent-first interactions.
+        # The request timeout makes the call itself give up at the deadline;
+        # a running future cannot be cancelled from here.
+        future = background_executor("chat", app.config["CHAT_MAX_CONCURRENCY"]).submit(
+            get_chat_model().generate_content, prompt,
+            request_options={"timeout": app.config["CHAT_TIMEOUT"]})
+    except Exception as e:
+        chat_slots.release()
+        print(f"Error: {e}")
+        return {"response": CHAT_ERROR}, 500
+    # The slot is held until the model call really ends, so calls stuck
+    # until their deadline keep new ones out instead of piling up behind them
+    future.add_done_callback(lambda _: chat_slots.release())
     try:
-        # Gemini 3 Flash is optimized for these agent-first interactions
-        response = model.generate_content(prompt)
+        response = future.result(timeout=app.config["CHAT_TIMEOUT"])
+        chat_cache.put(key, response.text)
         return {"response": response.text}
     except Exception as e:
         print(f"Error: {e}")
-        return {"response": "I'm having trouble thinking right now. Try again later!"}, 500
+        return {"response": CHAT_ERROR}, 500
+
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """Server-sent events: {"delta": "..."} chunks, then [DONE]."""
+    user_message, error = chat_request()
+    if error:
+        return error
+
+    def event(payload):
+        return f"data: {json.dumps(payload)}\n\n"
+
+    key = chat_cache_key(user_message)
+    hit = chat_cache.get(key)
+    if hit is not None:
+        def replay():
+            yield event({"delta": hit, "cached": True})
+            yield "data: [DONE]\n\n"
+        return Response(replay(), mimetype="text/event-stream")
+
+    prompt = build_chat_prompt(user_message)
+    if not chat_slots.acquire(timeout=app.config["CHAT_QUEUE_TIMEOUT"]):
+        return {"response": CHAT_BUSY}, 503
+
+    release = chat_slot_releaser()
+
+    def generate():
+        # The same per-call deadline as /chat: the request timeout bounds the
+        # wait for each chunk, the check below bounds the whole stream
+        deadline = time.monotonic() + app.config["CHAT_TIMEOUT"]
+        parts = []
+        chunks = None
+        try:
+            chunks = iter(get_chat_model().generate_content(
+                prompt, stream=True, request_options={"timeout": app.config["CHAT_TIMEOUT"]}))
+            for chunk in chunks:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"chat stream ran past {app.config['CHAT_TIMEOUT']}s")
+                parts.append(chunk.text)
+                yield event({"delta": chunk.text})
+            chat_cache.put(key, "".join(parts))
+        except Exception as e:
+            print(f"Error: {e}")
+            yield event({"error": CHAT_ERROR})
+        finally:
+            if chunks is not None and hasattr(chunks, "close"):
+                chunks.close()
+            release()
+        yield "data: [DONE]\n\n"
+
+    # close() runs even when the body is never iterated (client gone)
+    response = Response(generate(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.call_on_close(release)
+    return response
+
+
+# ---------------- CHAT CONTEXT ----------------
+CHAT_TOP_K = 4
+CHAT_FAQ = (
+    "Registration: students, wardens and guardians register under their college "
+    "and must be approved by the principal before they can log in. Principals "
+    "are approved by the admin.",
+    "Applying for a room: students browse the rooms of their college's hostels on "
+    "the student dashboard and click Apply; the principal approves the request "
+    "and a bed is allotted.",
+    "Room allotment: if the requested room is full the student gets another room "
+    "with a free bed in the same hostel; if the hostel is full the request stays "
+    "pending.",
+    "Attendance: wardens mark daily attendance (present or absent); students and "
+    "guardians can see attendance history and monthly percentages. Below 75% "
+    "attendance a student is listed as a defaulter.",
+    "Forgot password: an OTP is sent to the registered email address and is valid "
+    "for 5 minutes.",
+    "Room problems: wardens record facilities and damage reports for every room; "
+    "contact the warden to report damage.",
+)
+CHAT_STOPWORDS = frozenset("""
+    a an and are as at be by can do does for from how i in is it me my of on or
+    the there to what when where which who why will with you your
+""".split())
+PERSONAL_WORDS = frozenset("i me my mine am".split())
+
+
+def tokenize(text):
+    return [w for w in normalize_message(text).split() if w not in CHAT_STOPWORDS]
+
+
+def is_personal(message):
+    return not PERSONAL_WORDS.isdisjoint(normalize_message(message).split())
+
+
+class TfidfIndex:
+    """Tiny TF-IDF index for picking the snippets that go into a prompt."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        counts = [collections.Counter(tokenize(d)) for d in docs]
+        df = collections.Counter(t for c in counts for t in c)
+        self.idf = {t: math.log((len(docs) + 1) / (n + 1)) + 1 for t, n in df.items()}
+        self.postings = collections.defaultdict(list)
+        for i, c in enumerate(counts):
+            weights = {t: n * self.idf[t] for t, n in c.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for t, w in weights.items():
+                self.postings[t].append((i, w / norm))
+
+    def search(self, query, k=CHAT_TOP_K):
+        scores = collections.defaultdict(float)
+        for t, n in collections.Counter(tokenize(query)).items():
+            for i, w in self.postings.get(t, ()):
+                scores[i] += n * self.idf[t] * w
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [self.docs[i] for i, _ in best]
+
+
+def college_chat_index(db, college):
+    """FAQ + hostel + room snippets for a college, rebuilt after its writes."""
+    def build():
+        docs = list(CHAT_FAQ)
+        for h in db.execute("""
+            SELECT h.name, COUNT(r.id) AS rooms,
+                   COALESCE(SUM(r.capacity - r.occupied), 0) AS free_beds,
+                   COALESCE(SUM(r.occupied < r.capacity), 0) AS free_rooms
+            FROM hostels h
+            LEFT JOIN rooms r ON r.hostel_id = h.id
+            WHERE h.college = ?
+            GROUP BY h.id
+        """, (college,)):
+            docs.append(f"Hostel {h['name']} has {h['rooms']} rooms; {h['free_rooms']} rooms "
+                        f"have free beds ({h['free_beds']} free beds in total).")
+        for r in db.execute("""
+            SELECT h.name AS hostel_name, r.room_number, r.capacity, r.occupied,
+                   r.facilities, r.damage
+            FROM rooms r
+            JOIN hostels h ON r.hostel_id = h.id
+            WHERE h.college = ?
+        """, (college,)):
+            docs.append(f"Room {r['room_number']} in hostel {r['hostel_name']}: "
+                        f"{r['capacity'] - r['occupied']} of {r['capacity']} beds free; "
+                        f"facilities {r['facilities']}; damage {r['damage']}.")
+        return TfidfIndex(docs)
+
+    return cached(db, "chat_index", college, build)
+
+
+def chat_context(db, user_message):
+    """Facts about the caller plus the top-k snippets relevant to the question."""
+    lines = []
+    if is_personal(user_message) and session.get("role") == "student":
+        room = db.execute("""
+            SELECT r.room_number, h.name AS hostel_name
+            FROM users u
+            JOIN rooms r ON u.room_id = r.id
+            JOIN hostels h ON r.hostel_id = h.id
+            WHERE u.id = ?
+        """, (session["uid"],)).fetchone()
+        lines.append(f"The user's room is {room['room_number']} in hostel {room['hostel_name']}."
+                     if room else "The user has not been allotted a room yet.")
+        months = student_attendance_summary(db, session["uid"])
+        present = sum(m["present"] for m in months)
+        total = present + sum(m["absent"] for m in months)
+        if total:
+            lines.append(f"The user's attendance is {present} of {total} days "
+                         f"({100.0 * present / total:.1f}%).")
+
+    if session.get("college"):
+        lines += college_chat_index(db, session["college"]).search(user_message)
+    else:
+        lines += TfidfIndex(list(CHAT_FAQ)).search(user_message)
+    return lines
+
+# ---------------- CLI ----------------
+def mail_configured():
+    """False (with a warning) when there is no sender address to mail from."""
+    if not app.config["MAIL_SENDER"]:
+        print("Mailer not started: set MAIL_SENDER or MAIL_USERNAME/MAIL_PASSWORD in .env")
+        return False
+    if not (app.config["MAIL_USERNAME"] and app.config["MAIL_PASSWORD"]):
+        print("Mailer: MAIL_USERNAME/MAIL_PASSWORD unset, sending without SMTP login")
+    return True
+
+
+@app.cli.command("send-mail")
+def send_mail():
+    """Deliver every due message in the mail outbox, then exit."""
+    if not mail_configured():
+        raise click.ClickException("mail settings missing")
+    smtp = SMTPSession()
+    total = 0
+    try:
+        while True:
+            sent = mailer.deliver(smtp)
+            if not sent:
+                break
+            total += sent
+    finally:
+        smtp.close()
+    click.echo(f"{total} message(s) processed; queue: {mailer.snapshot(get_db())['queue']}")
+
+
+@app.cli.command("dedupe-uploads")
+@click.option("--dry-run", is_flag=True, help="Only report what would change.")
+def dedupe_uploads(dry_run):
+    """Collapse identical files in UPLOAD_FOLDER to one content-hashed copy.
+
+    References in users.id_card and room_photos.filename are rewritten, ID
+    cards are moved out of static/ into ID_CARD_FOLDER and WebP variants are
+    generated for the surviving room photos.
+    """
+    db = get_db()
+    renamed, removed = {}, 0
+    for name in sorted(os.listdir(UPLOAD_FOLDER)):
+        path = os.path.join(UPLOAD_FOLDER, name)
+        if not os.path.isfile(path) or name.endswith(".part"):
+            continue
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK), b""):
+                digest.update(chunk)
+        target = f"{digest.hexdigest()[:32]}{os.path.splitext(name)[1].lower()}"
+        if target == name:
+            continue
+        renamed[name] = target
+        if dry_run:
+            continue
+        if os.path.exists(os.path.join(UPLOAD_FOLDER, target)):
+            os.remove(path)
+            removed += 1
+        else:
+            os.replace(path, os.path.join(UPLOAD_FOLDER, target))
+
+    if not dry_run:
+        db.executemany("UPDATE users SET id_card=? WHERE id_card=?",
+                       ((new, old) for old, new in renamed.items()))
+        db.executemany("UPDATE room_photos SET filename=? WHERE filename=?",
+                       ((new, old) for old, new in renamed.items()))
+        for scope in {r["college"] for r in db.execute("SELECT DISTINCT college FROM hostels")}:
+            invalidate(db, scope)
+        db.commit()
+
+    cards = {renamed.get(r["id_card"], r["id_card"]) for r in
+             db.execute("SELECT id_card FROM users WHERE id_card IS NOT NULL")}
+    photos = {renamed.get(r["filename"], r["filename"]) for r in
+              db.execute("SELECT filename FROM room_photos")}
+    on_disk = set(os.listdir(UPLOAD_FOLDER)) | (set(renamed.values()) if dry_run else set())
+    moved = sorted(cards & on_disk)
+    if not dry_run:
+        for name in moved:
+            src = os.path.join(UPLOAD_FOLDER, name)
+            if name in photos:   # same bytes also used as a room photo
+                shutil.copy2(src, os.path.join(ID_CARD_FOLDER, name))
+            else:
+                os.replace(src, os.path.join(ID_CARD_FOLDER, name))
+        for name in photos & on_disk:
+            make_variants(name)
+
+    click.echo(f"{len(renamed)} file(s) renamed to content hashes, "
+               f"{len(set(renamed.values()))} distinct, {removed} duplicate(s) removed, "
+               f"{len(moved)} ID card(s) moved to {ID_CARD_FOLDER}"
+               + (" (dry run)" if dry_run else ""))
+
+
+@app.cli.command("archive-attendance")
+@click.option("--year", type=int, help="Only this academic year (its start year).")
+@click.option("--vacuum", is_flag=True, help="VACUUM the main database afterwards.")
+@click.option("--dry-run", is_flag=True, help="Only report what would be moved.")
+@click.option("--college", help="With SHARDING, archive this college's shard.")
+def archive_attendance(year, vacuum, dry_run, college):
+    """Move closed academic years of attendance into ARCHIVE_DIR.
+
+    Each year is copied into attendance_<year>.db (same rows and ids, same
+    indexes) and only then deleted from the hot table, so an interrupted run
+    can simply be repeated. The monthly/daily summaries keep the archived
+    history, and attendance for archived dates is refused from then on.
+    A shard's archives go to a subdirectory named after the shard.
+    """
+    db = get_db()
+    prefix = ""
+    if college:
+        if not app.config["SHARDING"] or not shard_path(college):
+            raise click.ClickException(f"no shard for {college!r} (is SHARDING=1 set?)")
+        db = college_db(college)
+        prefix = os.path.splitext(os.path.basename(shard_path(college)))[0] + "/"
+    current = academic_year(datetime.date.today().isoformat())
+    if year is not None and year >= current:
+        raise click.ClickException(f"{year}-{year + 1} is not closed yet")
+    oldest = db.execute("SELECT MIN(date) FROM attendance").fetchone()[0]
+    years = [year] if year is not None else (
+        range(academic_year(oldest), current) if oldest else [])
+
+    moved = 0
+    for y in years:
+        start, end = academic_year_range(y)
+        hot = db.execute("""
+            SELECT COUNT(*) FROM attendance WHERE date >= ? AND date < ?
+        """, (start, end)).fetchone()[0]
+        filename = f"{prefix}attendance_{y}.db"
+        path = os.path.join(app.config["ARCHIVE_DIR"], filename)
+        if not hot or dry_run:
+            if hot:
+                click.echo(f"{y}-{y + 1}: {hot:,} rows would move to {path}")
+            continue
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.chmod(path, 0o644)
+        db.execute("ATTACH ? AS archive_new", (path,))
+        try:
+            for statement in split_sql("""
+                CREATE TABLE IF NOT EXISTS archive_new.attendance (
+                    id INTEGER PRIMARY KEY,
+                    student_id INTEGER NOT NULL,
+                    warden_id INTEGER NOT NULL,
+                    date TEXT NOT NULL,
+                    status TEXT NOT NULL
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS archive_new.idx_attendance_student_date
+                    ON attendance(student_id, date);
+                CREATE INDEX IF NOT EXISTS archive_new.idx_attendance_date
+                    ON attendance(date);
+                CREATE INDEX IF NOT EXISTS archive_new.idx_attendance_warden_date
+                    ON attendance(warden_id, date);
+            """):
+                db.execute(statement)
+            # the hot row wins over one archived by an earlier, interrupted run
+            db.execute("""
+                INSERT OR REPLACE INTO archive_new.attendance
+                    (id, student_id, warden_id, date, status)
+                SELECT id, student_id, warden_id, date, status
+                FROM main.attendance
+                WHERE date >= ? AND date < ?
+            """, (start, end))
+            db.commit()
+            archived = db.execute("SELECT COUNT(*) FROM archive_new.attendance").fetchone()[0]
+
+            # Delete only rows the archive now holds, without touching the
+            # summaries: the delete trigger is dropped for this transaction
+            db.execute("BEGIN IMMEDIATE")
+            trigger = db.execute("""
+                SELECT sql FROM sqlite_master
+                WHERE type = 'trigger' AND name = 'trg_attendance_summary_delete'
+            """).fetchone()
+            if trigger:
+                db.execute("DROP TRIGGER trg_attendance_summary_delete")
+            deleted = db.execute("""
+                DELETE FROM main.attendance
+                WHERE date >= ? AND date < ?
+                AND id IN (SELECT id FROM archive_new.attendance)
+            """, (start, end)).rowcount
+            if trigger:
+                db.execute(trigger[0])
+            db.execute("""
+                INSERT INTO attendance_archives
+                    (year, filename, date_from, date_to, rows, archived_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (year) DO UPDATE SET
+                    rows = excluded.rows, archived_at = excluded.archived_at
+            """, (y, filename, start, end, archived, time.time()))
+            db.commit()
+            db.execute("ANALYZE archive_new")
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            db.execute("DETACH archive_new")
+        os.chmod(path, 0o444)
+        moved += deleted
+        click.echo(f"{y}-{y + 1}: {deleted:,} rows moved to {path}")
+
+    if vacuum and moved and not dry_run:
+        started = time.monotonic()
+        db.execute("VACUUM")
+        click.echo(f"vacuumed in {time.monotonic() - started:.1f}s")
+    remaining = db.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+    click.echo(f"{moved:,} row(s) archived, {remaining:,} left in attendance"
+               + (" (dry run)" if dry_run else ""))
+
+
+# College-owned rows `flask shard-database` moves into the shards, in
+# foreign-key order; {schema} is the database they are read from.
+SHARD_TABLES = {
+    "users": "college = :college",
+    "hostels": "college = :college",
+    "rooms": "hostel_id IN (SELECT id FROM {schema}.hostels WHERE college = :college)",
+    "applications": "student_id IN (SELECT id FROM {schema}.users WHERE college = :college)",
+    "room_photos": "hostel_id IN (SELECT id FROM {schema}.hostels WHERE college = :college)",
+    "attendance": "student_id IN (SELECT id FROM {schema}.users WHERE college = :college)",
+    "attendance_monthly": "student_id IN (SELECT id FROM {schema}.users WHERE college = :college)",
+    "attendance_daily_college": "college = :college",
+}
+
+
+@app.cli.command("shard-database")
+@click.option("--vacuum", is_flag=True, help="VACUUM the main database afterwards.")
+@click.option("--dry-run", is_flag=True, help="Only report what would be moved.")
+def shard_database(vacuum, dry_run):
+    """Split DATABASE into one shard per college under SHARD_DIR.
+
+    Every college's rows (SHARD_TABLES, archived attendance included) are
+    copied into a new shard with their ids and counted against the source.
+    Only when all shards are complete are the rows deleted from the main
+    database, in one transaction that also registers the shards and strips
+    the users rows down to directory entries, so an interrupted run can
+    simply be repeated. Stop the site first and start it with SHARDING=1
+    afterwards. Colleges that already have a shard are left alone.
+    """
+    db = get_db()
+    attach_archives(db)
+    colleges = [r[0] for r in db.execute("""
+        SELECT college FROM users WHERE college != ''
+        UNION
+        SELECT college FROM hostels WHERE college != ''
+        EXCEPT
+        SELECT college FROM shards
+    """)]
+    archives = db.execute("SELECT year, filename FROM attendance_archives ORDER BY year").fetchall()
+
+    def expected(college):
+        return {table: db.execute(
+            f"SELECT COUNT(*) FROM {'attendance_all' if table == 'attendance' else table} "
+            f"WHERE {where.format(schema='main')}", {"college": college}).fetchone()[0]
+            for table, where in SHARD_TABLES.items()}
+
+    shards = {}
+    for college in colleges:
+        counts = expected(college)
+        path = os.path.join(app.config["SHARD_DIR"], shard_filename(college))
+        if dry_run:
+            click.echo(f"{college}: {counts['users']:,} users, {counts['rooms']:,} rooms, "
+                       f"{counts['attendance']:,} attendance rows would move to {path}")
+            continue
+
+        started = time.monotonic()
+        os.makedirs(app.config["SHARD_DIR"], exist_ok=True)
+        tmp = path + ".tmp"
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        shard = create_database(tmp)
+        try:
+            shard.execute("PRAGMA journal_mode = MEMORY")
+            shard.execute("PRAGMA synchronous = OFF")
+            shard.execute("ATTACH ? AS src", (app.config["DATABASE"],))
+            sources = ["src"]
+            for year, filename in archives:
+                shard.execute(f"ATTACH ? AS archive_{year}",
+                              (os.path.join(app.config["ARCHIVE_DIR"], filename),))
+                sources.append(f"archive_{year}")
+
+            shard.execute("BEGIN")
+            # the summaries are copied as they are, not rebuilt row by row
+            triggers = shard.execute("""
+                SELECT name, sql FROM sqlite_master
+                WHERE type = 'trigger' AND tbl_name = 'attendance'
+            """).fetchall()
+            for name, _ in triggers:
+                shard.execute(f"DROP TRIGGER {name}")
+            copied = collections.Counter()
+            for table, where in SHARD_TABLES.items():
+                columns = ", ".join(r["name"] for r in shard.execute(f"PRAGMA table_info({table})"))
+                for source in sources if table == "attendance" else ["src"]:
+                    copied[table] += shard.execute(
+                        f"INSERT INTO {table} ({columns}) SELECT {columns} "
+                        f"FROM {source}.{table} WHERE {where.format(schema='src')}",
+                        {"college": college}).rowcount
+            for _, sql in triggers:
+                shard.execute(sql)
+            if copied != collections.Counter(counts):
+                raise click.ClickException(
+                    f"{college}: copied {dict(copied)}, expected {counts}; nothing was deleted")
+            shard.commit()
+            shard.execute("ANALYZE")
+        finally:
+            shard.close()
+        os.replace(tmp, path)
+        shards[college] = os.path.basename(path)
+        click.echo(f"{college}: {copied['users']:,} users, {copied['attendance']:,} "
+                   f"attendance rows copied to {path} in {time.monotonic() - started:.1f}s")
+
+    if dry_run or not shards:
+        click.echo(f"{len(colleges)} college(s) to shard" + (" (dry run)" if dry_run else ""))
+        return
+
+    # Delete what the shards now hold, without touching the summaries
+    # row by row: the delete trigger is dropped for this transaction
+    started = time.monotonic()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        trigger = db.execute("""
+            SELECT sql FROM sqlite_master
+            WHERE type = 'trigger' AND name = 'trg_attendance_summary_delete'
+        """).fetchone()
+        if trigger:
+            db.execute("DROP TRIGGER trg_attendance_summary_delete")
+        for college, filename in shards.items():
+            for table, where in reversed(SHARD_TABLES.items()):
+                if table != "users":
+                    db.execute(f"DELETE FROM main.{table} WHERE {where.format(schema='main')}",
+                               {"college": college})
+            db.execute("""
+                UPDATE users SET password='', id_card=NULL, room_id=NULL WHERE college=?
+            """, (college,))
+            db.execute("INSERT INTO shards (college, filename) VALUES (?, ?)", (college, filename))
+        if trigger:
+            db.execute(trigger[0])
+        # archived years now live in the shards' own attendance tables
+        db.execute("DELETE FROM attendance_archives")
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    click.echo(f"{len(shards)} college(s) removed from {app.config['DATABASE']} "
+               f"in {time.monotonic() - started:.1f}s")
+    if archives:
+        click.echo(f"{len(archives)} archive file(s) in {app.config['ARCHIVE_DIR']} are no longer "
+                   f"used; run archive-attendance --college to archive each shard")
+    if vacuum:
+        started = time.monotonic()
+        db.execute("VACUUM")
+        click.echo(f"vacuumed in {time.monotonic() - started:.1f}s")
+
+
+def create_database(path):
+    """Create an empty, fully migrated database at `path` and return a connection."""
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    with open("database.sql") as f:
+        db.executescript(f.read())
+    migrate_db(db)
+    return db
+
+
+def rebuild_attendance_summaries(db):
+    """Recompute attendance_monthly / attendance_daily_college from scratch
+    (archived years included)."""
+    attach_archives(db)
+    db.execute("DELETE FROM attendance_monthly")
+    db.execute("DELETE FROM attendance_daily_college")
+    db.execute("""
+        INSERT INTO attendance_monthly (student_id, month, present, absent)
+        SELECT student_id, substr(date, 1, 7),
+               SUM(status = 'present'), SUM(status = 'absent')
+        FROM attendance_all
+        GROUP BY student_id, substr(date, 1, 7)
+    """)
+    db.execute("""
+        INSERT INTO attendance_daily_college (college, date, present, absent)
+        SELECT u.college, a.date,
+               SUM(a.status = 'present'), SUM(a.status = 'absent')
+        FROM attendance_all a
+        JOIN users u ON a.student_id = u.id
+        WHERE u.college IS NOT NULL
+        GROUP BY u.college, a.date
+    """)
+
+
+SEED_FACILITIES = ("AC", "WiFi", "Attached Bathroom", "Balcony", "Study Lamp", "Cupboard")
+
+
+def seed_database(db, colleges=4, hostels=3, rooms=30, students=200, days=365,
+                  photos=0, seed=1, password="bench"):
+    """Fill an empty database with a deterministic synthetic campus.
+
+    Every college gets a principal, a guardian and one warden per hostel;
+    90% of its students are allotted a bed (with an approved application)
+    and have `days` of attendance, the rest have a pending application.
+    Each room gets `photos` room_photos rows and "Bed, Table, Fan" plus up
+    to three SEED_FACILITIES. All accounts share `password` (hashed once).
+    Usernames: principal<c>, guardian<c>, warden<c>_<h>, student<c>_<i>.
+
+    Built for volume: attendance rows are streamed straight into
+    executemany, and the attendance indexes and summary triggers are
+    dropped during the load and rebuilt once at the end.
+    """
+    rnd = random.Random(seed)
+    extras = random.Random(seed + 2)   # own stream, so older seeds keep their layout
+    pw = hash_password(password)
+    today = datetime.date.today()
+    dates = [(today - datetime.timedelta(days=d)).isoformat() for d in range(days, 0, -1)]
+
+    uid = db.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0]
+    hid = db.execute("SELECT COALESCE(MAX(id), 0) FROM hostels").fetchone()[0]
+    rid = db.execute("SELECT COALESCE(MAX(id), 0) FROM rooms").fetchone()[0]
+    users, hostel_rows, room_rows, applications = [], [], [], []
+    residents = []   # (student id, warden id) of everyone with a bed
+
+    for c in range(1, colleges + 1):
+        college = f"College {c}"
+        for role in ("principal", "guardian"):
+            uid += 1
+            users.append((uid, f"{role}{c}", pw, role, college, 1, None))
+
+        beds = []   # (room id, hostel id, warden id) per free bed
+        for h in range(1, hostels + 1):
+            uid += 1
+            hid += 1
+            users.append((uid, f"warden{c}_{h}", pw, "warden", college, 1, None))
+            hostel_rows.append([hid, f"Hostel {c}-{h}", college, uid, rooms, rooms])
+            for block, floor, number in room_layout(rooms, floors=3, blocks=["A", "B"]):
+                rid += 1
+                facilities = ", ".join(["Bed", "Table", "Fan"] + extras.sample(
+                    SEED_FACILITIES, extras.randint(0, 3)))
+                room_rows.append([rid, hid, number, 3, 0, block, floor, facilities])
+                beds += [(rid, hid, uid)] * 3
+        rnd.shuffle(beds)
+
+        for i in range(1, students + 1):
+            uid += 1
+            if i <= students * 0.9 and beds:
+                room_id, hostel_id, warden_id = beds.pop()
+                users.append((uid, f"student{c}_{i}", pw, "student", college, 1, room_id))
+                applications.append((uid, hostel_id, room_id, "approved"))
+                residents.append((uid, warden_id))
+            else:
+                users.append((uid, f"student{c}_{i}", pw, "student", college, 1, None))
+                room_id, hostel_id, _ = rnd.choice(beds or [(None, hid, None)])
+                applications.append((uid, hostel_id, room_id, "pending"))
+
+    # Derive occupancy from the allotments made above
+    occupied = collections.Counter(u[6] for u in users if u[6])
+    room_index = {r[0]: r for r in room_rows}
+    for room_id, count in occupied.items():
+        room_index[room_id][4] = count
+    full = collections.Counter(r[1] for r in room_rows if r[4] >= r[3])
+    for row in hostel_rows:
+        row[5] = row[4] - full[row[0]]
+
+    def attendance():
+        marks = random.Random(seed + 1)
+        for date in dates:
+            for student_id, warden_id in residents:
+                yield (student_id, warden_id, date,
+                       "present" if marks.random() < 0.85 else "absent")
+
+    def photo_rows():
+        for room_id, hostel_id, *_ in room_rows:
+            warden_id = hostel_rows[hostel_id - hostel_rows[0][0]][3]
+            for n in range(photos):
+                yield (hostel_id, room_id, warden_id, f"seed_{room_id}_{n}.jpg")
+
+    # Bulk-load settings; the file is rebuilt from scratch if the load dies
+    saved = {name: db.execute(f"PRAGMA {name}").fetchone()[0]
+             for name in ("journal_mode", "synchronous", "cache_size")}
+    db.execute("PRAGMA journal_mode = MEMORY")
+    db.execute("PRAGMA synchronous = OFF")
+    db.execute("PRAGMA cache_size = -262144")   # 256 MB for the index builds
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        deferred = db.execute("""
+            SELECT type, name, sql FROM sqlite_master
+            WHERE tbl_name = 'attendance' AND type IN ('index', 'trigger') AND sql IS NOT NULL
+        """).fetchall()
+        for kind, name, _ in deferred:
+            db.execute(f"DROP {kind.upper()} {name}")
+        bulk_insert(db, users, hostel_rows, room_rows, applications, photo_rows(), attendance())
+        for _, _, sql in deferred:
+            db.execute(sql)
+        rebuild_attendance_summaries(db)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        for name, value in saved.items():
+            db.execute(f"PRAGMA {name} = {value}")
+
+    return {"users": len(users), "hostels": len(hostel_rows), "rooms": len(room_rows),
+            "applications": len(applications), "photos": len(room_rows) * photos,
+            "attendance": len(residents) * len(dates)}
+
+
+def bulk_insert(db, users, hostels, rooms, applications, photos, attendance):
+    db.executemany("""
+        INSERT INTO users (id, username, password, role, college, approved, room_id)
+        VALUES (?,?,?,?,?,?,?)
+    """, users)
+    db.executemany("""
+        INSERT INTO hostels (id, name, college, warden_id, total_rooms, available_rooms)
+        VALUES (?,?,?,?,?,?)
+    """, hostels)
+    db.executemany("""
+        INSERT INTO rooms (id, hostel_id, room_number, capacity, occupied, block, floor,
+                           facilities)
+        VALUES (?,?,?,?,?,?,?,?)
+    """, rooms)
+    db.executemany("""
+        INSERT INTO applications (student_id, hostel_id, room_id, status) VALUES (?,?,?,?)
+    """, applications)
+    db.executemany("""
+        INSERT INTO room_photos (hostel_id, room_id, warden_id, filename) VALUES (?,?,?,?)
+    """, photos)
+    db.executemany("""
+        INSERT INTO attendance (student_id, warden_id, date, status) VALUES (?,?,?,?)
+    """, attendance)
+
+
+@app.cli.command("generate-data")
+@click.argument("database")
+@click.option("--colleges", default=20)
+@click.option("--hostels", default=5, help="Hostels per college.")
+@click.option("--rooms", default=100, help="Rooms per hostel (3 beds each).")
+@click.option("--students", default=1500, help="Students per college.")
+@click.option("--days", default=365, help="Days of attendance per allotted student.")
+@click.option("--photos", default=1, help="room_photos rows per room.")
+@click.option("--seed", default=1, help="Same seed, same dataset.")
+@click.option("--password", default="bench", help="Password of every generated account.")
+def generate_data(database, colleges, hostels, rooms, students, days, photos, seed, password):
+    """Create DATABASE and fill it with a large deterministic synthetic campus.
+
+    The defaults give about 10M attendance rows. Point the app at the
+    result with DATABASE=<file>.
+    """
+    if os.path.exists(database):
+        raise click.UsageError(f"{database} already exists; pick a new file")
+    started = time.monotonic()
+    db = create_database(database)
+    try:
+        counts = seed_database(db, colleges, hostels, rooms, students, days,
+                               photos=photos, seed=seed, password=password)
+        db.execute("ANALYZE")
+    finally:
+        db.close()
+    elapsed = time.monotonic() - started
+    click.echo(f"{database}: " + ", ".join(f"{v} {k}" for k, v in counts.items()))
+    click.echo(f"{sum(counts.values())} rows in {elapsed:.1f}s "
+               f"({sum(counts.values()) / elapsed:,.0f} rows/s), "
+               f"{os.path.getsize(database) / 1e6:.0f} MB")
+
+
+@app.cli.command("bench-login")
+@click.option("--logins", default=200, help="Password verifications per run.")
+@click.option("--concurrency", default=32, help="Concurrent login requests.")
+@click.option("--method", default=None, help="Hash method to measure (default PASSWORD_METHOD).")
+def bench_login(logins, concurrency, method):
+    """Measure password verifications per second under the hashing policy.
+
+    Compares unbounded hashing on every request thread with the
+    PASSWORD_WORKERS pool used by login().
+    """
+    if method:
+        app.config["PASSWORD_METHOD"] = method
+    stored = hash_password("bench")
+    cores = os.cpu_count() or 1
+    click.echo(f"{app.config['PASSWORD_METHOD']}: {logins} logins, {concurrency} concurrent, "
+               f"{cores} core(s), pool of {app.config['PASSWORD_WORKERS']}")
+    for label, verify in (("request threads", check_password_hash), ("password pool", verify_password)):
+        started = time.monotonic()
+        with ThreadPoolExecutor(concurrency) as executor:
+            ok = sum(executor.map(lambda _: verify(stored, "bench"), range(logins)))
+        rate = logins / (time.monotonic() - started)
+        click.echo(f"{label:<16}{rate:8.1f} logins/s {rate / cores:8.1f} per core  ({ok}/{logins} ok)")
+
+
+@app.cli.command("bench-startup")
+@click.option("--runs", default=5, help="Fresh interpreters to time.")
+@click.option("--top", default=10, help="Slowest direct imports to list.")
+@click.option("--record", default=None, help="Append the result as a JSON line to this file.")
+def bench_startup(runs, top, record):
+    """Time `import app` in fresh interpreters with -X importtime.
+
+    Reports the median wall time and import time of the module plus its
+    slowest direct imports; --record keeps a history to compare commits.
+    """
+    import statistics
+    import subprocess   # imported here: only this command needs them
+
+    walls, totals, children = [], [], collections.defaultdict(list)
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                              cwd=app.root_path, capture_output=True, text=True)
+        walls.append(time.perf_counter() - started)
+        if proc.returncode:
+            raise click.ClickException(proc.stderr.strip().splitlines()[-1])
+        # Children are printed before their parent, indented two spaces a level
+        direct = []
+        for line in proc.stderr.splitlines():
+            fields = line[len("import time:"):].split("|")
+            if len(fields) != 3 or not fields[1].strip().isdigit():
+                continue
+            name, seconds = fields[2][1:], int(fields[1]) / 1e6
+            if not name.startswith(" "):
+                if name == "app":
+                    totals.append(seconds)
+                    for child, child_seconds in direct:
+                        children[child].append(child_seconds)
+                direct = []
+            elif not name.startswith("   "):
+                direct.append((name.strip(), seconds))
+
+    slowest = sorted(((statistics.median(v), k) for k, v in children.items()), reverse=True)[:top]
+    result = {
+        "at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=app.root_path,
+                                 capture_output=True, text=True).stdout.strip(),
+        "wall": statistics.median(walls),
+        "import": statistics.median(totals),
+        "slowest": {name: seconds for seconds, name in slowest},
+    }
+    click.echo(f"{runs} run(s): startup {result['wall'] * 1000:.0f} ms, "
+               f"import app {result['import'] * 1000:.0f} ms")
+    for seconds, name in slowest:
+        click.echo(f"  {seconds * 1000:8.1f} ms  {name}")
+    if record:
+        with open(record, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
 if __name__ == "__main__":
-    init_db()
-    app.run(host="0.0.0.0", port=10000)
+    create_app().run(host="0.0.0.0", port=10000)
@@ -0,0 +1,213 @@
+"""Load benchmark: seed a synthetic campus and replay every role's workflow.
+
+Kept out of app.py so the server never imports the HTTP client and timing
+code. Run it with python bench.py --help.
+"""
+import collections
+import datetime
+import http.cookiejar
+import json
+import math
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from app import app, create_database, seed_database
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class BenchClient:
+    """One virtual user: keeps its own cookies, never follows redirects.
+
+    Talks to a running server when `url` is given, otherwise to the app
+    in-process through Flask's test client.
+    """
+
+    def __init__(self, url=None):
+        self.url = url
+        if url:
+            self.opener = urllib.request.build_opener(
+                urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+        else:
+            self.client = app.test_client()
+
+    def request(self, method, path, form=None, json_body=None):
+        if not self.url:
+            resp = self.client.open(path, method=method, data=form, json=json_body)
+            resp.close()
+            return resp.status_code
+
+        data, headers = None, {}
+        if json_body is not None:
+            data, headers = json.dumps(json_body).encode(), {"Content-Type": "application/json"}
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode()
+        req = urllib.request.Request(self.url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=30) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+def bench_plan(db):
+    """Accounts and work items the scenarios draw from."""
+    users = collections.defaultdict(list)
+    for r in db.execute("SELECT username, role, college FROM users WHERE approved=1"):
+        users[r["role"]].append((r["username"], r["college"]))
+    roster = collections.defaultdict(list)
+    for r in db.execute("""
+        SELECT h.warden_id, u.id FROM users u
+        JOIN rooms r ON u.room_id = r.id
+        JOIN hostels h ON r.hostel_id = h.id
+    """):
+        roster[r["warden_id"]].append(r["id"])
+    wardens = {r["username"]: roster[r["id"]] for r in
+               db.execute("SELECT id, username FROM users WHERE role='warden'")}
+    pending = collections.defaultdict(list)
+    for r in db.execute("""
+        SELECT a.id, u.college FROM applications a JOIN users u ON a.student_id = u.id
+        WHERE a.status='pending'
+    """):
+        pending[r["college"]].append(r["id"])
+    return users, wardens, pending
+
+
+@click.command()
+@click.option("--database", default=None, help="Benchmark database; seeded if it does not exist (default: a throwaway file).")
+@click.option("--url", default=None, help="Drive a running server (e.g. http://127.0.0.1:8000) instead of the in-process app.")
+@click.option("--colleges", default=4)
+@click.option("--hostels", default=3, help="Hostels per college.")
+@click.option("--rooms", default=30, help="Rooms per hostel.")
+@click.option("--students", default=200, help="Students per college.")
+@click.option("--days", default=365, help="Days of attendance history per student.")
+@click.option("--seed", default=1, help="Random seed for the data and the request mix.")
+@click.option("--sessions", "iterations", default=300, help="Virtual user sessions to run.")
+@click.option("--concurrency", default=8, help="Virtual users running at once.")
+@click.option("--json", "json_path", default=None, help="Also write the results to this JSON file.")
+def bench(database, url, colleges, hostels, rooms, students, days, seed,
+          iterations, concurrency, json_path):
+    """Seed a synthetic campus and replay every role's workflow against it.
+
+    Each virtual user logs in as a random student, warden, principal or
+    guardian and walks that role's pages (a warden also submits a roll
+    call, a principal approves a pending application). Reports
+    p50/p95/p99 latency per step and overall throughput. With --url,
+    start the server on the same file first, e.g.
+    DATABASE=bench.db gunicorn -w 4 app:app.
+
+    Usage: python bench.py [--sessions 300 --concurrency 8 --json results.json]
+    """
+    tmp = None
+    if database is None:
+        tmp = tempfile.mkdtemp()
+        database = os.path.join(tmp, "bench.db")
+    try:
+        if not os.path.exists(database):
+            started = time.monotonic()
+            db = create_database(database)
+            counts = seed_database(db, colleges, hostels, rooms, students, days, seed=seed)
+            db.close()
+            click.echo(f"seeded {database} in {time.monotonic() - started:.1f}s: "
+                       + ", ".join(f"{v} {k}" for k, v in counts.items()))
+        db = sqlite3.connect(database)
+        db.row_factory = sqlite3.Row
+        users, wardens, pending = bench_plan(db)
+        db.close()
+        if not url:
+            app.config["DATABASE"] = database
+
+        today = datetime.date.today().isoformat()
+        lock = threading.Lock()
+        timings = collections.defaultdict(list)
+        errors = collections.Counter()
+
+        def step(client, name, method, path, **kwargs):
+            started = time.perf_counter()
+            status = client.request(method, path, **kwargs)
+            elapsed = time.perf_counter() - started
+            with lock:
+                timings[name].append(elapsed)
+                if status >= 400 or (name == "login" and status != 302):
+                    errors[name] += 1
+
+        def run(i):
+            rnd = random.Random(seed * 100003 + i)
+            role = rnd.choices(["student", "warden", "principal", "guardian"], [50, 20, 10, 20])[0]
+            username, college = rnd.choice(users[role])
+            client = BenchClient(url)
+            step(client, "login", "POST", "/", form={"username": username, "password": "bench"})
+            if role == "student":
+                step(client, "GET /student", "GET", "/student")
+                step(client, "GET /rooms/search", "GET", "/rooms/search?" + rnd.choice(
+                    ["q=wifi", "q=ac&min_free=1&sort=free", "tag=balcony", "min_free=2"]))
+                step(client, "GET /attendance/feed", "GET", "/attendance/feed?limit=50")
+                step(client, "GET /attendance/summary", "GET", "/attendance/summary")
+            elif role == "warden":
+                step(client, "GET /warden", "GET", "/warden")
+                records = [{"student_id": sid, "status": rnd.choice(["present", "absent"])}
+                           for sid in wardens.get(username, [])]
+                step(client, "POST rollcall", "POST", "/warden/attendance/rollcall",
+                     json_body={"date": today, "records": records})
+            elif role == "principal":
+                step(client, "GET /principal", "GET", "/principal")
+                with lock:
+                    aid = pending[college].pop() if pending[college] else None
+                if aid:
+                    step(client, "approve hostel", "GET", f"/principal/approve_hostel/{aid}")
+            else:
+                step(client, "GET /guardian", "GET", "/guardian")
+                step(client, "GET /attendance/summary", "GET", "/attendance/summary")
+            step(client, "logout", "GET", "/logout")
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(run, range(iterations)))
+        elapsed = time.monotonic() - started
+
+        results = {}
+        click.echo(f"{'step':<26}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name in sorted(timings):
+            xs = sorted(timings[name])
+            results[name] = {"count": len(xs), "errors": errors[name],
+                             **{f"p{p}": percentile(xs, p) * 1000 for p in (50, 95, 99)}}
+            r = results[name]
+            click.echo(f"{name:<26}{r['count']:>7}{r['errors']:>8}"
+                       f"{r['p50']:>10.1f}{r['p95']:>10.1f}{r['p99']:>10.1f}")
+        total = sum(len(xs) for xs in timings.values())
+        click.echo(f"{total} requests in {elapsed:.1f}s: {total / elapsed:.1f} req/s, "
+                   f"{sum(errors.values())} error(s)")
+        if json_path:
+            with open(json_path, "w") as f:
+                json.dump({"elapsed": elapsed, "requests": total,
+                           "throughput": total / elapsed, "steps": results}, f, indent=2)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    bench()
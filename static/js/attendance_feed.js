@@ -0,0 +1,46 @@
+// Infinite scroll for the attendance lists backed by /attendance/feed.
+// The first page is rendered by the dashboard; later pages are fetched with
+// the (date|id) cursor from data-next, keeping the current filters.
+function escapeHtml(value) {
+    const div = document.createElement("div");
+    div.textContent = value == null ? "" : String(value);
+    return div.innerHTML;
+}
+
+function attendanceFeed(list, renderRow) {
+    const sentinel = document.getElementById("attendance-sentinel");
+    const filters = new URLSearchParams(window.location.search);
+    let next = list.dataset.next;
+    let loading = false;
+
+    if (!next) {
+        sentinel.remove();
+        return;
+    }
+
+    const observer = new IntersectionObserver(async (entries) => {
+        if (!entries[0].isIntersecting || loading || !next) return;
+        loading = true;
+        filters.set("cursor", next);
+
+        const res = await fetch("/attendance/feed?" + filters.toString());
+        if (res.ok) {
+            const page = await res.json();
+            page.items.forEach((a) => list.insertAdjacentHTML("beforeend", renderRow(a)));
+            next = page.next;
+        } else {
+            next = null;
+        }
+
+        loading = false;
+        observer.unobserve(sentinel);
+        if (next) {
+            // re-observe so a still-visible sentinel triggers the next page
+            observer.observe(sentinel);
+        } else {
+            sentinel.remove();
+        }
+    }, { rootMargin: "200px" });
+
+    observer.observe(sentinel);
+}
@@ -0,0 +1,19 @@
+import pytest
+
+import app
+
+
+@pytest.fixture
+def campus(tmp_path, monkeypatch):
+    """Test client on a small seeded campus ("College 1", password "bench")."""
+    path = str(tmp_path / "campus.db")
+    db = app.create_database(path)
+    app.seed_database(db, colleges=1, hostels=1, rooms=4, students=10, days=100)
+    db.close()
+    monkeypatch.setitem(app.app.config, "DATABASE", path)
+    return app.app.test_client()
+
+
+def login(client, username, password="bench"):
+    client.get("/logout")
+    return client.post("/", data={"username": username, "password": password})
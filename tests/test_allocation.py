@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+from conftest import login
+
+WORKERS = 32
+APPLICATIONS = 400
+ROOMS = 20
+CAPACITY = 3
+
+
+def test_concurrent_approvals_never_overbook(tmp_path):
+    """Approve applications from many threads at once; no room may overbook."""
+    path = str(tmp_path / "stress.db")
+    db = app.create_database(path)
+
+    college = "Stress College"
+    db.execute("""
+        INSERT INTO users (username, password, role, college, approved)
+        VALUES ('stress_warden', '-', 'warden', ?, 1)
+    """, (college,))
+    hostel_id = db.execute("""
+        INSERT INTO hostels (name, college, warden_id, total_rooms, available_rooms)
+        VALUES ('Stress Hostel', ?, 1, ?, ?)
+    """, (college, ROOMS, ROOMS)).lastrowid
+    db.executemany("""
+        INSERT INTO rooms (hostel_id, room_number, capacity) VALUES (?,?,?)
+    """, ((hostel_id, f"R{i}", CAPACITY) for i in range(1, ROOMS + 1)))
+    db.executemany("""
+        INSERT INTO users (username, password, role, college, approved)
+        VALUES (?, '-', 'student', ?, 1)
+    """, ((f"stress_student_{i}", college) for i in range(APPLICATIONS)))
+    # Everyone asks for one of the first three rooms to force contention
+    db.execute("""
+        INSERT INTO applications (student_id, hostel_id, room_id, status)
+        SELECT id, ?, ? + (id % 3), 'pending' FROM users WHERE role='student'
+    """, (hostel_id, db.execute("SELECT MIN(id) FROM rooms").fetchone()[0]))
+    db.commit()
+    aids = [r[0] for r in db.execute("SELECT id FROM applications")]
+
+    pool = app.ConnectionPool(path, size=WORKERS)
+
+    def approve(aid):
+        conn = pool.acquire()
+        try:
+            return app.allocate_room(conn, aid, college)[0]
+        finally:
+            pool.release(conn)
+
+    with ThreadPoolExecutor(WORKERS) as executor:
+        results = list(executor.map(approve, aids))
+    pool.close()
+
+    assert db.execute("SELECT COUNT(*) FROM rooms WHERE occupied > capacity").fetchone()[0] == 0
+    assert results.count("approved") == min(APPLICATIONS, ROOMS * CAPACITY)
+    # occupied agrees with the students actually placed in each room
+    assert db.execute("""
+        SELECT COUNT(*) FROM rooms r
+        WHERE occupied != (SELECT COUNT(*) FROM users u WHERE u.room_id = r.id)
+    """).fetchone()[0] == 0
+    available = db.execute("SELECT available_rooms FROM hostels").fetchone()[0]
+    assert available == db.execute(
+        "SELECT COUNT(*) FROM rooms WHERE occupied < capacity").fetchone()[0]
+    db.close()
+
+
+def test_batch_allotment_report_rows_share_one_shape(campus):
+    with app.app.app_context():
+        db = app.main_db()
+        roomed = db.execute("""
+            SELECT u.id, r.hostel_id FROM users u JOIN rooms r ON u.room_id = r.id LIMIT 1
+        """).fetchone()
+        db.execute("""
+            INSERT INTO applications (student_id, hostel_id, status) VALUES (?, ?, 'pending')
+        """, (roomed["id"], roomed["hostel_id"]))
+        db.commit()
+
+    login(campus, "principal1")
+    report = campus.post("/principal/allocate_all", json={}).get_json()["report"]
+    assert "duplicate" in {r["outcome"] for r in report}
+    assert len({frozenset(r) for r in report}) == 1
@@ -0,0 +1,39 @@
+import app
+from conftest import login
+
+
+def register(client, role, username):
+    """Register a pending `role` account in College 1; returns its id."""
+    client.post(f"/register/{role}", data={
+        "username": username, "password": "bench", "college": "College 1",
+        "email": f"{username}@example.com", "phone": username})
+    with app.app.app_context():
+        return app.main_db().execute(
+            "SELECT id FROM users WHERE username=?", (username,)).fetchone()[0]
+
+
+def test_principal_approves_guardian(campus):
+    uid = register(campus, "guardian", "newguardian")
+    login(campus, "principal1")
+    assert b"newguardian" in campus.get("/principal").data
+
+    campus.get(f"/principal/approve_user/{uid}")
+    with app.app.app_context():
+        assert app.main_db().execute(
+            "SELECT approved FROM users WHERE id=?", (uid,)).fetchone()[0] == 1
+    login(campus, "newguardian")
+    assert campus.get("/guardian").status_code == 200
+
+
+def test_principal_rejects_guardian_in_batch(campus):
+    uid = register(campus, "guardian", "badguardian")
+    login(campus, "principal1")
+    response = campus.post("/principal/users/decide", json={"reject": [uid]})
+    assert response.get_json() == {"approved": 0, "rejected": 1}
+
+
+def test_principal_queue_limit_is_clamped(campus):
+    register(campus, "guardian", "pendingguardian")
+    login(campus, "principal1")
+    for limit in ("0", "-1", "-5"):
+        assert campus.get(f"/principal?limit={limit}").status_code == 200
@@ -0,0 +1,44 @@
+"""Microbenchmarks of the hot paths; run with pytest-benchmark installed.
+
+python -m pytest tests/test_benchmarks.py --benchmark-autosave, then
+--benchmark-compare to check a change against the saved run. The load
+test of whole workflows is bench.py.
+"""
+import pytest
+
+import app
+from conftest import login
+
+pytest.importorskip("pytest_benchmark")
+
+
+def test_login(benchmark, campus):
+    benchmark(login, campus, "student1_1")
+
+
+@pytest.mark.parametrize("username, page", [
+    ("student1_1", "/student"),
+    ("warden1_1", "/warden"),
+    ("principal1", "/principal"),
+    ("guardian1", "/guardian"),
+    ("student1_1", "/attendance/feed?limit=50"),
+    ("student1_1", "/attendance/summary"),
+    ("student1_1", "/rooms/search?q=wifi&min_free=1&sort=free"),
+])
+def test_page(benchmark, campus, username, page):
+    login(campus, username)
+    response = benchmark(campus.get, page)
+    assert response.status_code == 200
+
+
+def test_college_attendance_summary(benchmark, campus):
+    with app.app.app_context():
+        db = app.main_db()
+        rows = benchmark(app.college_attendance_summary, db, "College 1")
+    assert rows
+
+
+def test_room_layout(benchmark):
+    layout = benchmark(lambda: list(app.room_layout(app.MAX_HOSTEL_ROOMS, 10, ["A", "B"],
+                                                     "{block}{floor}{room:02d}")))
+    assert len(layout) == app.MAX_HOSTEL_ROOMS
@@ -0,0 +1,86 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import app
+from conftest import login
+
+
+class FakeModel:
+    """Stands in for the Gemini model; streams `chunks` `delay` seconds apart."""
+
+    def __init__(self, chunks=("Hello", " there"), delay=0):
+        self.chunks, self.delay = chunks, delay
+        self.request_options = []
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        self.request_options.append(request_options)
+        if not stream:
+            return SimpleNamespace(text="".join(self.chunks))
+        return self.stream()
+
+    def stream(self):
+        for text in self.chunks:
+            time.sleep(self.delay)
+            yield SimpleNamespace(text=text)
+
+
+@pytest.fixture
+def model(monkeypatch):
+    fake = FakeModel()
+    monkeypatch.setitem(app.app.extensions, "chat_model", fake)
+    return fake
+
+
+def free_slots():
+    taken = 0
+    while app.chat_slots.acquire(blocking=False):
+        taken += 1
+    for _ in range(taken):
+        app.chat_slots.release()
+    return taken
+
+
+def test_chat_passes_the_deadline_to_the_model(campus, model):
+    login(campus, "student1_1")
+    response = campus.post("/chat", json={"message": "when is the mess open?"})
+    assert response.get_json() == {"response": "Hello there"}
+    assert model.request_options == [{"timeout": app.app.config["CHAT_TIMEOUT"]}]
+    time.sleep(0.1)   # the slot is given back by the executor's done callback
+    assert free_slots() == app.app.config["CHAT_MAX_CONCURRENCY"]
+
+
+def test_chat_stream_stops_at_the_deadline(campus, model, monkeypatch):
+    monkeypatch.setitem(app.app.config, "CHAT_TIMEOUT", 0.2)
+    model.chunks, model.delay = ["a", "b", "c", "d"], 0.1
+    login(campus, "student1_2")
+    body = campus.post("/chat/stream", json={"message": "what rooms are free?"}).get_data(True)
+    assert app.CHAT_ERROR in body
+    assert body.endswith("data: [DONE]\n\n")
+    assert model.request_options == [{"timeout": 0.2}]
+    assert free_slots() == app.app.config["CHAT_MAX_CONCURRENCY"]
+
+
+def test_chat_stream_releases_the_slot_once(campus, model):
+    login(campus, "student1_3")
+    for question in ("who is my warden?", "how do I apply for a room?"):
+        response = campus.post("/chat/stream", json={"message": question})
+        assert '"delta": "Hello"' in response.get_data(True)
+        response.close()
+    assert free_slots() == app.app.config["CHAT_MAX_CONCURRENCY"]
+
+
+@pytest.mark.parametrize("endpoint", ["/chat", "/chat/stream"])
+def test_chat_rejects_long_messages(campus, model, endpoint):
+    login(campus, "student1_4")
+    message = "x" * (app.app.config["CHAT_MAX_CHARS"] + 1)
+    response = campus.post(endpoint, json={"message": message})
+    assert response.status_code == 400
+    assert model.request_options == []
+
+
+@pytest.mark.parametrize("body", [["hi"], "hi", {"message": 5}, {"message": ["hi"]}])
+def test_chat_rejects_malformed_bodies(campus, model, body):
+    login(campus, "student1_5")
+    assert campus.post("/chat", json=body).status_code == 400
@@ -0,0 +1,40 @@
+import collections
+import sqlite3
+
+import pytest
+
+import app
+
+
+def test_release_after_close_closes_the_connection(tmp_path):
+    pool = app.ConnectionPool(str(tmp_path / "pool.db"), size=2)
+    idle, out = pool.acquire(), pool.acquire()
+    pool.release(idle)
+    pool.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        idle.execute("SELECT 1")
+
+    pool.release(out)
+    with pytest.raises(sqlite3.ProgrammingError):
+        out.execute("SELECT 1")
+    assert pool.snapshot()["open"] == 0
+
+
+def test_evicted_shard_pool_closes_checked_out_connections(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.app.config, "DATABASE", str(tmp_path / "main.db"))
+    monkeypatch.setitem(app.app.config, "SHARD_DIR", str(tmp_path / "shards"))
+    monkeypatch.setitem(app.app.config, "SHARD_POOLS_MAX", 1)
+    monkeypatch.setattr(app, "shard_pools", collections.OrderedDict())
+    app.create_database(app.app.config["DATABASE"]).close()
+
+    with app.app.app_context():
+        first = app.shard_pool("College A", create=True)
+        db = first.acquire()
+        app.shard_pool("College B", create=True)   # evicts College A's pool
+        assert first.closed
+        first.release(db)
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.execute("SELECT 1")
+    assert first.snapshot()["open"] == 0
+    for pool in app.shard_pools.values():
+        pool.close()
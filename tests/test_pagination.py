@@ -0,0 +1,21 @@
+import pytest
+
+import app
+from conftest import login
+
+
+@pytest.mark.parametrize("limit", ["0", "-1", "-5", "100000"])
+def test_attendance_feed_limit_is_clamped(campus, limit):
+    login(campus, "student1_1")
+    response = campus.get(f"/attendance/feed?limit={limit}")
+    assert response.status_code == 200
+    assert 1 <= len(response.get_json()["items"]) <= app.ATTENDANCE_PAGE_SIZE * 4
+
+
+@pytest.mark.parametrize("limit", ["0", "-1", "-5", "100000"])
+def test_room_search_limit_is_clamped(campus, limit):
+    login(campus, "student1_1")
+    response = campus.get(f"/rooms/search?limit={limit}")
+    assert response.status_code == 200
+    assert 1 <= len(response.get_json()["items"]) <= app.ROOM_PAGE_SIZE * 4
+    assert campus.get(f"/student?limit={limit}").status_code == 200
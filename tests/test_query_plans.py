@@ -0,0 +1,68 @@
+"""Every literal SQL query in app.py must avoid full scans of large tables."""
+import ast
+import re
+
+import app
+
+# Tables that grow with students x days; a full SCAN of any of them on a
+# request path is a regression.
+LARGE_TABLES = {"users", "rooms", "applications", "attendance", "room_photos",
+                "attendance_monthly", "attendance_daily_college", "mail_outbox",
+                "sessions", "room_tags", "attendance_all"}
+# Functions that are allowed to walk whole tables (or query attached files)
+QUERY_PLAN_EXEMPT = {"debug_users", "dedupe_uploads", "seed_database",
+                     "rebuild_attendance_summaries", "archive_attendance", "shard_database"}
+
+
+def collect_queries():
+    """Yield (function, line, sql) for every literal SQL string run in app.py."""
+    with open(app.__file__) as f:
+        tree = ast.parse(f.read())
+
+    for func in ast.walk(tree):
+        if not isinstance(func, ast.FunctionDef):
+            continue
+        for node in ast.walk(func):
+            if not (isinstance(node, ast.Call)
+                    and isinstance(node.func, ast.Attribute)
+                    and node.func.attr in ("execute", "executemany")
+                    and node.args
+                    and isinstance(node.args[0], ast.Constant)
+                    and isinstance(node.args[0].value, str)):
+                continue
+            sql = node.args[0].value.strip()
+            if sql.split(None, 1)[0].upper() in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE"):
+                yield func.name, node.lineno, sql
+
+
+def find_scan_regressions(db):
+    """EXPLAIN every query; return (checked, [(line, function, plan detail)])."""
+    failures, seen = [], set()
+    for name, lineno, sql in collect_queries():
+        if lineno in seen or name in QUERY_PLAN_EXEMPT:
+            continue
+        seen.add(lineno)
+
+        # alias -> table, so "SCAN a" can be traced back to attendance
+        tables = {}
+        for table, alias in re.findall(
+                r"(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", sql, re.I):
+            tables[table] = table
+            if alias:
+                tables[alias] = table
+
+        plan = db.execute("EXPLAIN QUERY PLAN " + sql, (None,) * sql.count("?"))
+        for row in plan:
+            words = row[3].split()
+            if words[0] == "SCAN" and tables.get(words[1], words[1]) in LARGE_TABLES:
+                failures.append((lineno, name, row[3]))
+    return len(seen), failures
+
+
+def test_no_full_scans_of_large_tables(tmp_path):
+    db = app.create_database(str(tmp_path / "plans.db"))
+    checked, failures = find_scan_regressions(db)
+    db.close()
+    assert checked > 50
+    assert not failures, "\n".join(f"app.py:{line} {name}(): {detail}"
+                                   for line, name, detail in failures)
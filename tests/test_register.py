@@ -0,0 +1,27 @@
+import io
+import os
+
+import app
+
+
+def register_student(client, username, card):
+    return client.post("/register/student", data={
+        "username": username, "password": "bench", "college": "College 1",
+        "email": f"{username}@example.com", "phone": username,
+        "id_card": (io.BytesIO(card), "card.png")})
+
+
+def test_duplicate_registration_leaves_no_id_card(campus, tmp_path, monkeypatch):
+    folder = tmp_path / "id_cards"
+    folder.mkdir()
+    monkeypatch.setattr(app, "ID_CARD_FOLDER", str(folder))
+
+    register_student(campus, "newstudent", b"first card")
+    assert len(os.listdir(folder)) == 1
+    register_student(campus, "newstudent", b"second card")
+    assert len(os.listdir(folder)) == 1
+
+    with app.app.app_context():
+        card = app.main_db().execute(
+            "SELECT id_card FROM users WHERE username='newstudent'").fetchone()[0]
+    assert os.listdir(folder) == [card]
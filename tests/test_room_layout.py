@@ -0,0 +1,101 @@
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize("template", [
+    "{n.__class__}",             # attribute access
+    "{n.foo}",
+    "{n[0]}",                    # indexing
+    "{n:>99999999999}",          # huge width
+    "{n:0999d}",
+    "{n!r}",                     # conversion
+    "{user}",                    # unknown field
+    "{}",                        # positional field
+    "{0}",
+    "{n:{floor}}",               # nested spec
+    "R{n",                       # malformed
+    "R" * 65 + "{n}",            # too long
+])
+def test_rejected_templates(template):
+    with pytest.raises(ValueError):
+        list(app.room_layout(3, 1, None, template))
+
+
+def test_allowed_template():
+    layout = list(app.room_layout(4, 2, ["A"], "{block}{floor}{room:02d}-{n}"))
+    assert [number for _, _, number in layout] == ["A101-1", "A102-2", "A201-3", "A202-4"]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.app.config, "DATABASE", str(tmp_path / "test.db"))
+    app.create_app()
+    return app.app.test_client()
+
+
+def test_add_hostel_caps(client):
+    with client.session_transaction() as s:
+        s.update(role="warden", uid=1, college="Test College")
+    for form in ({"total_rooms": app.MAX_HOSTEL_ROOMS + 1},
+                 {"total_rooms": 1, "floors": app.MAX_HOSTEL_FLOORS + 1},
+                 {"total_rooms": 1, "blocks": ",".join(["X"] * (app.MAX_HOSTEL_BLOCKS + 1))}):
+        response = client.post("/warden/add_hostel", data={"hostel_name": "H", **form})
+        assert response.status_code == 302
+    with client.session_transaction() as s:
+        assert any("At most" in message for _, message in s["_flashes"])
+
+
+@pytest.fixture
+def warden(client):
+    """The client logged in as a warden with one 2-room hostel (capacity 3)."""
+    with client.session_transaction() as s:
+        s.update(role="warden", uid=1, college="Test College")
+    client.post("/warden/add_hostel", data={"hostel_name": "H", "total_rooms": 2})
+    return client
+
+
+def capacities():
+    with app.app.app_context():
+        return [r[0] for r in app.main_db().execute("SELECT capacity FROM rooms ORDER BY id")]
+
+
+@pytest.mark.parametrize("capacity", ["0", "-3", str(app.MAX_ROOM_CAPACITY + 1)])
+def test_add_hostel_rejects_capacity(client, capacity):
+    with client.session_transaction() as s:
+        s.update(role="warden", uid=1, college="Test College")
+    client.post("/warden/add_hostel", data={"hostel_name": "H", "total_rooms": 2,
+                                            "capacity": capacity})
+    assert capacities() == []
+
+
+@pytest.mark.parametrize("capacity", ["", "abc", "2.5"])
+def test_update_rooms_keeps_capacity_on_blank_input(warden, capacity):
+    warden.post("/warden/update_room", data={"room_id": 1, "capacity": capacity,
+                                             "facilities": "WiFi", "damage": ""})
+    warden.post("/warden/update_rooms", json={"rooms": [{"room_id": 2, "capacity": capacity}]})
+    assert capacities() == [3, 3]
+
+
+@pytest.mark.parametrize("capacity", ["-1", "0", str(app.MAX_ROOM_CAPACITY + 1)])
+def test_update_rooms_rejects_capacity(warden, capacity):
+    warden.post("/warden/update_room", data={"room_id": 1, "capacity": capacity,
+                                             "facilities": "", "damage": ""})
+    response = warden.post("/warden/update_rooms",
+                           json={"rooms": [{"room_id": 2, "capacity": 4},
+                                           {"room_id": 1, "capacity": int(capacity)}]})
+    assert response.status_code == 400
+    assert capacities() == [3, 3]
+
+
+def test_update_rooms_applies_capacity(warden):
+    response = warden.post("/warden/update_rooms", data={"room_ids": ["1", "2"], "capacity": "5"})
+    assert response.status_code == 302
+    assert capacities() == [5, 5]
+
+
+@pytest.mark.parametrize("body", ["[]", "[1, 2]", '"rooms"', "3", "null", "{bad",
+                                  '{"rooms": {}}', '{"rooms": [1]}', '{"rooms": ["x"]}'])
+def test_update_rooms_rejects_malformed_json(warden, body):
+    response = warden.post("/warden/update_rooms", data=body, content_type="application/json")
+    assert response.status_code == 400